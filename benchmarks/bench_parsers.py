@@ -0,0 +1,49 @@
+"""Сравнение скорости бэкендов разбора HTML на странице категории FunPay.
+
+Запуск: python benchmarks/bench_parsers.py [--lots 500] [--repeat 5]
+Сеть не нужна: страница генерируется локально.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from pages import make_category_page  # noqa: E402
+
+
+def bench(func, repeat: int) -> float:
+    """Минимальное время выполнения из нескольких повторов, мс"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, default=500, help='количество лотов на странице')
+    parser.add_argument('--repeat', type=int, default=5, help='количество повторов')
+    args = parser.parse_args()
+
+    html = make_category_page(args.lots)
+    print(f"Страница: {len(html) / 1024:.0f} КБ, лотов: {args.lots}")
+    print("Время разбора страницы и поиска контейнеров лотов")
+    print(f"{'бэкенд':<14}{'полное дерево, мс':>20}{'только tc-item, мс':>20}")
+
+    for backend in bot.available_parser_backends():
+        full = bench(lambda: backend.parse(html).find_all(['div', 'a'], class_='tc-item'), args.repeat)
+        strained = bench(
+            lambda: backend.parse(html, only_lots=True).find_all(['div', 'a'], class_='tc-item'),
+            args.repeat,
+        )
+        active = ' (активен)' if backend == bot.parser_backend else ''
+        print(f"{backend.name:<14}{full:>20.1f}{strained:>20.1f}{active}")
+
+
+if __name__ == '__main__':
+    main()
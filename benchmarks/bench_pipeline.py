@@ -0,0 +1,181 @@
+"""Бенчмарк разбора и фильтрации категорий FunPay без сети.
+
+Замеряет по этапам время разбора HTML, поиска контейнеров, извлечения данных лотов,
+разбора цен, фильтров пользователя (по одному лоту и пакетом), сортировки по цене
+и сопоставления через общие индексы на сохраненных страницах /lots/ и /chips/
+и на синтетических страницах до 10 000 лотов.
+
+Запуск:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --compare benchmarks/baseline.json --tolerance 0.25
+
+При сравнении с эталоном скрипт завершается с кодом 1, если какой-либо этап
+замедлился больше допустимого.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from pages import load_fixture, scale_page  # noqa: E402
+
+KEYWORDS = ['steam', 'аккаунт', 'dota', 'brainrot', 'pet', 'ключ', 'скин', 'gold', 'золото',
+            'valorant', 'genshin', 'roblox', 'прокачка', 'редкий', 'cs2', 'awp']
+
+
+def build_pages(sizes):
+    """Набор страниц: образцы как есть и образец /lots/ в увеличенном масштабе"""
+    lots_page = load_fixture('lots')
+    chips_page = load_fixture('chips')
+    pages = {
+        'lots': ('https://funpay.com/lots/1000/', lots_page),
+        'chips': ('https://funpay.com/chips/2/', chips_page),
+    }
+    for size in sizes:
+        pages[f'lots-{size}'] = (f'https://funpay.com/lots/{size}/', scale_page(lots_page, size))
+    return pages
+
+
+def make_users(count: int, seed: int = 1):
+    """Синтетические пользователи с ключевыми словами и диапазонами цен"""
+    rng = random.Random(seed)
+    users = {}
+    for user_id in range(1, count + 1):
+        min_price = rng.choice([0, 0, 50, 100, 500])
+        max_price = rng.choice([float('inf'), 1000, 3000, 10000])
+        users[user_id] = bot.UserSettings(
+            keywords=rng.sample(KEYWORDS, rng.randint(1, 4)),
+            min_price=min_price,
+            max_price=max_price,
+        )
+    return users
+
+
+def timeit(func, repeat: int):
+    """Лучшее время из нескольких повторов, мс, и результат последнего вызова"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, result
+
+
+def bench_page(url: str, html: str, users, repeat: int):
+    """Замер этапов обработки одной страницы"""
+    stages = {}
+    backend = bot.parser_backend
+
+    # Профиль извлечения выучивается на первом разборе, как при обычной работе бота
+    bot.extraction_profiles.pop(url, None)
+    bot.parse_category_html(html, url)
+    profile = bot.extraction_profiles.get(url)
+
+    stages['parse'], soup = timeit(lambda: backend.parse(html), repeat)
+    container = profile.container if profile else bot.LOT_SELECTORS[0]
+    stages['containers'], elements = timeit(lambda: bot.find_lot_elements(soup, container), repeat)
+    stages['extract'], lots = timeit(
+        lambda: [bot.extract_lot_data(element, url, profile) for element in elements], repeat)
+    lots = [lot for lot in lots if lot]
+    price_texts = [lot.price_text for lot in lots]
+    stages['extract_price'], _ = timeit(lambda: [bot.extract_price(text) for text in price_texts], repeat)
+    stages['apply_filters'], _ = timeit(
+        lambda: [lot for settings in users.values() for lot in lots if bot.apply_filters(lot, settings)], repeat)
+    # Пакет строится один раз на страницу, как в кэше лотов /find
+    batch = bot.LotBatch(lots)
+    stages['batch_filters'], _ = timeit(lambda: [batch.filter(settings) for settings in users.values()], repeat)
+    stages['sort_top'], _ = timeit(lambda: batch.cheapest(8), repeat)
+    user_ids = set(users)
+    stages['match_lots'], _ = timeit(lambda: bot.match_lots(lots, user_ids), repeat)
+    stages['pipeline'], _ = timeit(lambda: bot.parse_category_html(html, url), repeat)
+
+    tracemalloc.start()
+    bot.parse_category_html(html, url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'lots': len(lots),
+        'size_kb': round(len(html.encode()) / 1024, 1),
+        'stages_ms': {name: round(value, 3) for name, value in stages.items()},
+        'lots_per_sec': round(len(lots) / (stages['pipeline'] / 1000)) if stages['pipeline'] else 0,
+        'peak_memory_kb': round(peak / 1024),
+    }
+
+
+def print_report(results):
+    for name, result in results.items():
+        print(f"\n{name}: {result['lots']} лотов, {result['size_kb']} КБ, "
+              f"{result['lots_per_sec']} лотов/с, пик памяти {result['peak_memory_kb']} КБ")
+        for stage, value in result['stages_ms'].items():
+            print(f"  {stage:<16}{value:>12.2f} мс")
+
+
+def compare(results, baseline, tolerance: float) -> bool:
+    """Сравнение с эталоном; True, если замедлений сверх допуска нет"""
+    ok = True
+    print(f"\nСравнение с эталоном (допуск {tolerance:.0%}):")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"  {name}: нет в эталоне, пропущено")
+            continue
+        for stage, value in result['stages_ms'].items():
+            base_value = base['stages_ms'].get(stage)
+            if not base_value:
+                continue
+            change = value / base_value - 1
+            regressed = change > tolerance
+            ok = ok and not regressed
+            mark = 'ЗАМЕДЛЕНИЕ' if regressed else 'ok'
+            print(f"  {name:<12}{stage:<16}{base_value:>10.2f} -> {value:>10.2f} мс ({change:+.0%}) {mark}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='размеры синтетических страниц через запятую (по умолчанию 1000,10000)')
+    parser.add_argument('--users', type=int, default=100, help='количество синтетических пользователей')
+    parser.add_argument('--repeat', type=int, default=3, help='количество повторов каждого замера')
+    parser.add_argument('--save-baseline', metavar='FILE', help='сохранить результаты как эталон')
+    parser.add_argument('--compare', metavar='FILE', help='сравнить с сохраненным эталоном')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустимое замедление, доля')
+    args = parser.parse_args()
+
+    bot.logger.setLevel(logging.WARNING)
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    users = make_users(args.users)
+    bot.user_settings.clear()
+    bot.user_settings.update(users)
+    bot.reindex_all_users()
+
+    print(f"Парсер: {bot.parser_backend.name}, пользователей: {len(users)}")
+    results = {}
+    for name, (url, html) in build_pages(sizes).items():
+        results[name] = bench_page(url, html, users, args.repeat)
+    print_report(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nЭталон сохранен в {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""Нагрузочный стенд: локальная замена FunPay и Telegram Bot API.
+
+Поднимает на 127.0.0.1 сервер с шаблонными страницами категорий (задержки, ошибки,
+появление новых лотов) и поддельный Telegram Bot API, который записывает отправленные
+сообщения. Заполняет user_settings синтетическими пользователями и прогоняет
+monitor_lots и find_lots из bot.py против обоих серверов.
+
+Запуск: python benchmarks/load_harness.py --users 2000 --categories 200 --cycles 5
+
+Отчет: длительность цикла, число загрузок за цикл, задержка уведомлений
+(от появления лота на стенде до получения сообщения) и задержка цикла событий.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from aiohttp import web  # noqa: E402
+from telegram import Bot  # noqa: E402
+
+WORDS = ['steam', 'аккаунт', 'dota', 'brainrot', 'pet', 'ключ', 'скин', 'gold', 'золото',
+         'valorant', 'genshin', 'roblox', 'прокачка', 'редкий', 'cs2', 'awp', 'буст', 'донат']
+OFFER_ID_RE = re.compile(r'offer\?id=(\d+)')
+TOKEN = '123456:LOADTEST'
+
+
+class FunPayStandIn:
+    """Сервер с шаблонными страницами категорий FunPay"""
+
+    def __init__(self, lots: int, churn: float, latency: float, jitter: float,
+                 error_rate: float, slow_rate: float, slow: float, reprice: float = 0.0,
+                 pages: int = 1, seed: int = 1):
+        self.lots = lots
+        self.pages = pages
+        self.churn = churn
+        self.reprice = reprice
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow = slow
+        self.rng = random.Random(seed)
+        self.categories = {}
+        self.created_at = {}
+        self.requests = 0
+        self.errors = 0
+
+    def _new_lot(self, category: int, state):
+        state['seq'] += 1
+        offer_id = category * 1_000_000 + state['seq']
+        title = f"{self.rng.choice(WORDS)} {self.rng.choice(WORDS)} лот #{offer_id}"
+        price = round(self.rng.uniform(10, 5000), 2)
+        self.created_at[offer_id] = time.monotonic()
+        return offer_id, title, price
+
+    def _state(self, category: int):
+        state = self.categories.get(category)
+        if state is None:
+            state = self.categories[category] = {'seq': 0, 'items': [], 'updated': time.monotonic()}
+            state['items'] = [self._new_lot(category, state) for _ in range(self.lots * self.pages)]
+        return state
+
+    def _advance(self, category: int, state):
+        """Появление новых лотов и изменение цен с заданной частотой, вытеснение старых"""
+        now = time.monotonic()
+        elapsed = now - state['updated']
+        expected = elapsed * self.churn
+        count = int(expected) + (1 if self.rng.random() < expected - int(expected) else 0)
+        state['updated'] = now
+        if self.reprice:
+            probability = min(1.0, elapsed * self.reprice)
+            state['items'] = [
+                (offer_id, title, round(price * self.rng.uniform(0.5, 1.1), 2))
+                if self.rng.random() < probability else (offer_id, title, price)
+                for offer_id, title, price in state['items']
+            ]
+        if count:
+            state['items'] = [self._new_lot(category, state) for _ in range(count)] + state['items']
+            del state['items'][self.lots * self.pages:]
+
+    def render(self, category: int, page_no: int = 1) -> str:
+        """Страница категории; при pages > 1 лоты делятся на страницы ?page=N"""
+        state = self._state(category)
+        self._advance(category, state)
+        start = (page_no - 1) * self.lots
+        items = ''.join(
+            f'<a href="https://funpay.com/lots/offer?id={offer_id}" class="tc-item">'
+            f'<div class="tc-server hidden-xxs">EU</div>'
+            f'<div class="tc-desc"><div class="tc-desc-text">{title}</div></div>'
+            f'<div class="tc-user"><div class="media-user-name">seller</div></div>'
+            f'<div class="tc-price" data-s="{price}"><div>{price} <span class="unit">₽</span></div></div>'
+            f'</a>'
+            for offer_id, title, price in state['items'][start:start + self.lots]
+        )
+        return (f'<html><body data-app-data=\'{{"csrf-token":"{self.rng.random()}"}}\'>'
+                f'<div class="tc table-hover">{items}</div></body></html>')
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        if self.rng.random() < self.slow_rate:
+            delay += self.slow
+        await asyncio.sleep(delay)
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, text='Service Unavailable')
+        page_no = int(request.query.get('page', 1))
+        return web.Response(text=self.render(int(request.match_info['category']), page_no), content_type='text/html')
+
+
+class TelegramStandIn:
+    """Поддельный Telegram Bot API, записывающий отправленные сообщения"""
+
+    def __init__(self, stand_in: FunPayStandIn):
+        self.funpay = stand_in
+        self.sent = []
+        self.latencies = []
+        self.message_id = 0
+
+    def _message(self, chat_id, text):
+        self.message_id += 1
+        return {
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'text': text,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'}
+        elif method in ('sendMessage', 'editMessageText'):
+            text = data.get('text', '')
+            now = time.monotonic()
+            self.sent.append((method, data.get('chat_id'), now))
+            if method == 'sendMessage':
+                for offer_id in OFFER_ID_RE.findall(text):
+                    created = self.funpay.created_at.get(int(offer_id))
+                    if created is not None:
+                        self.latencies.append(now - created)
+            result = self._message(data.get('chat_id', 0), text)
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+
+class LoopLagMonitor:
+    """Замер задержки цикла событий: насколько позже срока просыпается задача"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags = []
+        self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+
+
+class FakeMessage:
+    """Сообщение пользователя для вызова обработчиков команд без Telegram"""
+
+    def __init__(self, tg_bot: Bot, chat_id: int, message_id: int = 0):
+        self.bot = tg_bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    async def reply_text(self, text, **kwargs):
+        sent = await self.bot.send_message(chat_id=self.chat_id, text=text, **kwargs)
+        return FakeMessage(self.bot, self.chat_id, sent.message_id)
+
+    async def edit_text(self, text, **kwargs):
+        await self.bot.edit_message_text(chat_id=self.chat_id, message_id=self.message_id, text=text, **kwargs)
+        return self
+
+
+class FakeUpdate:
+    def __init__(self, tg_bot: Bot, user_id: int):
+        self.effective_user = type('User', (), {'id': user_id})()
+        self.message = FakeMessage(tg_bot, user_id)
+
+
+class FakeContext:
+    args = []
+
+
+def populate_users(users: int, categories: int, per_user: int, base_url: str, seed: int = 1):
+    """Заполнение user_settings синтетическими пользователями с мониторингом"""
+    rng = random.Random(seed)
+    bot.user_settings.clear()
+    bot.monitored_users.clear()
+    for user_id in range(1, users + 1):
+        chosen = rng.sample(range(1, categories + 1), min(per_user, categories))
+        bot.user_settings[user_id] = bot.UserSettings(
+            categories=[f'{base_url}/lots/{category}/' for category in chosen],
+            keywords=rng.sample(WORDS, rng.randint(1, 3)),
+            min_price=rng.choice([0, 0, 100, 500]),
+            max_price=rng.choice([float('inf'), 1000, 3000]),
+        )
+        bot.monitored_users.add(user_id)
+    bot.reindex_all_users()
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def describe(values, unit: str = 'с') -> str:
+    if not values:
+        return 'нет данных'
+    return (f"p50 {percentile(values, 0.5):.3f} {unit}, p95 {percentile(values, 0.95):.3f} {unit}, "
+            f"макс {max(values):.3f} {unit}, n={len(values)}")
+
+
+async def run(args):
+    funpay = FunPayStandIn(args.lots, args.churn, args.latency, args.jitter,
+                           args.error_rate, args.slow_rate, args.slow, args.reprice, args.pages)
+    telegram = TelegramStandIn(funpay)
+
+    app = web.Application()
+    app.router.add_get('/lots/{category}/', funpay.handle)
+    app.router.add_post('/bot{token}/{method}', telegram.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', args.port)
+    await site.start()
+    base_url = f'http://127.0.0.1:{args.port}'
+
+    tg_bot = Bot(TOKEN, base_url=f'{base_url}/bot')
+    await tg_bot.initialize()
+    populate_users(args.users, args.categories, args.per_user, base_url)
+
+    lag = LoopLagMonitor()
+    lag.start()
+    print(f"Пользователей: {args.users}, категорий: {args.categories}, лотов на странице: {args.lots}, "
+          f"процессов разбора: {bot.PARSE_WORKERS}")
+
+    cycle_times, fetches = [], []
+    for cycle in range(1, args.cycles + 1):
+        requests_before = funpay.requests
+        started = time.monotonic()
+        await bot.monitor_lots(tg_bot, force=True)
+        cycle_times.append(time.monotonic() - started)
+        fetches.append(funpay.requests - requests_before)
+        print(f"Цикл {cycle}: {cycle_times[-1]:.2f} с, загрузок {fetches[-1]}, "
+              f"в очереди уведомлений {bot.get_notifier(tg_bot).queued_lots} лотов")
+        await asyncio.sleep(args.pause)
+
+    find_times = []
+    if args.find:
+        async def timed_find(user_id: int):
+            started = time.monotonic()
+            await bot.find_lots(FakeUpdate(tg_bot, user_id), FakeContext())
+            find_times.append(time.monotonic() - started)
+
+        user_ids = random.Random(2).sample(sorted(bot.user_settings), min(args.find, len(bot.user_settings)))
+        await asyncio.gather(*(timed_find(user_id) for user_id in user_ids))
+
+    # Ждем, пока очередь уведомлений опустеет
+    notifier = bot.get_notifier(tg_bot)
+    deadline = time.monotonic() + args.drain_timeout
+    while notifier.queued_lots and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+    await lag.stop()
+    await notifier.stop()
+    bot.notifier = None
+    await bot.close_http_session()
+    bot.close_parse_pool()
+    await tg_bot.shutdown()
+    await runner.cleanup()
+
+    print("\nИтоги:")
+    print(f"  Длительность цикла: среднее {statistics.mean(cycle_times):.2f} с, {describe(cycle_times)}")
+    print(f"  Загрузок за цикл: среднее {statistics.mean(fetches):.1f}, "
+          f"всего запросов {funpay.requests}, ошибок стенда {funpay.errors}")
+    print(f"  Отправлено сообщений: {sum(1 for method, _, _ in telegram.sent if method == 'sendMessage')}, "
+          f"осталось в очереди лотов: {notifier.queued_lots}")
+    print(f"  Задержка уведомлений: {describe(telegram.latencies)}")
+    if find_times:
+        print(f"  /find: {describe(find_times)}")
+    print(f"  Задержка цикла событий: {describe(lag.lags)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000, help='количество пользователей')
+    parser.add_argument('--categories', type=int, default=200, help='количество категорий')
+    parser.add_argument('--per-user', type=int, default=3, help='категорий у одного пользователя')
+    parser.add_argument('--lots', type=int, default=50, help='лотов на странице категории')
+    parser.add_argument('--pages', type=int, default=1, help='страниц в категории на стенде')
+    parser.add_argument('--max-pages', type=int, default=bot.CATEGORY_MAX_PAGES,
+                        help='сколько страниц категории обходит бот')
+    parser.add_argument('--churn', type=float, default=0.05, help='новых лотов в категории в секунду')
+    parser.add_argument('--reprice', type=float, default=0.0, help='доля лотов, меняющих цену за секунду')
+    parser.add_argument('--latency', type=float, default=0.1, help='задержка ответа стенда, с')
+    parser.add_argument('--jitter', type=float, default=0.05, help='разброс задержки, с')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='доля ответов с ошибкой')
+    parser.add_argument('--slow-rate', type=float, default=0.01, help='доля очень медленных ответов')
+    parser.add_argument('--slow', type=float, default=5.0, help='дополнительная задержка медленного ответа, с')
+    parser.add_argument('--cycles', type=int, default=5, help='количество циклов мониторинга')
+    parser.add_argument('--pause', type=float, default=2.0, help='пауза между циклами, с')
+    parser.add_argument('--find', type=int, default=0, help='сколько одновременных /find выполнить')
+    parser.add_argument('--drain-timeout', type=float, default=30.0,
+                        help='сколько ждать опустошения очереди уведомлений, с')
+    parser.add_argument('--parse-workers', type=int, default=bot.PARSE_WORKERS,
+                        help='процессов разбора страниц (0 - разбирать в цикле событий)')
+    parser.add_argument('--port', type=int, default=8089, help='порт стенда')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    bot.PARSE_WORKERS = args.parse_workers
+    bot.CATEGORY_MAX_PAGES = args.max_pages
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
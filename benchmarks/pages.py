@@ -0,0 +1,56 @@
+"""Страницы категорий FunPay для бенчмарков: сохраненные образцы и синтетические страницы."""
+import os
+import re
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+LOT_ITEM_RE = re.compile(r'<a href="[^"]*offer\?id=[^"]*" class="tc-item".*?</a>\s*', re.S)
+OFFER_ID_RE = re.compile(r'offer\?id=[^"]*"')
+
+
+def load_fixture(name: str) -> str:
+    """Сохраненная страница категории из benchmarks/fixtures"""
+    with open(os.path.join(FIXTURES_DIR, f'{name}.html'), encoding='utf-8') as f:
+        return f.read()
+
+
+def scale_page(html: str, lots: int) -> str:
+    """Страница с тем же оформлением, в которой лоты образца повторены до нужного количества"""
+    items = LOT_ITEM_RE.findall(html)
+    if not items:
+        raise ValueError('на странице нет лотов tc-item')
+    first = html.index(items[0])
+    last = html.rindex(items[-1]) + len(items[-1])
+    scaled = [
+        OFFER_ID_RE.sub(f'offer?id={900000000 + i}"', items[i % len(items)], count=1)
+        for i in range(lots)
+    ]
+    return html[:first] + ''.join(scaled) + html[last:]
+
+
+def make_category_page(lots: int) -> str:
+    """Синтетическая страница категории в разметке FunPay"""
+    header = (
+        '<html><head><title>FunPay</title>'
+        + '<script>window.app = {};</script>' * 20
+        + '</head><body data-app-data=\'{"csrf-token":"x"}\'>'
+        + '<nav class="navbar">' + '<a class="menu-item" href="/">Меню</a>' * 200 + '</nav>'
+        + '<div class="tc table-hover"><div class="tc-header"><div class="tc-desc">Описание</div>'
+        + '<div class="tc-price">Цена</div></div>'
+    )
+    items = []
+    for i in range(lots):
+        items.append(
+            f'<a href="https://funpay.com/lots/offer?id={1000000 + i}" class="tc-item">'
+            f'<div class="tc-server hidden-xxs">Сервер {i % 7}</div>'
+            f'<div class="tc-desc"><div class="tc-desc-text">Аккаунт Steam #{i} с играми, полный доступ</div></div>'
+            f'<div class="tc-user"><div class="media media-user"><div class="media-body">'
+            f'<div class="media-user-name">seller{i % 97}</div>'
+            f'<div class="media-user-reviews"><div class="rating-stars rating-5"></div></div>'
+            f'</div></div></div>'
+            f'<div class="tc-price" data-s="{100 + i % 900}.5"><div>{100 + i % 900}.5 '
+            f'<span class="unit">₽</span></div></div>'
+            f'</a>'
+        )
+    footer = '</div><footer>' + '<p class="footer-item">Ссылка</p>' * 100 + '</footer></body></html>'
+    return header + ''.join(items) + footer
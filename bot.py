@@ -1,15 +1,31 @@
 import asyncio
+import bisect
+import hashlib
+import heapq
+import json
 import logging
+import multiprocessing
 import re
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+import signal
+import sqlite3
+import sys
+import time
+from array import array
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from math import inf, nan
+from typing import List, Optional, Dict, Any, Set, Tuple, Deque, Iterable
 from dataclasses import dataclass, field
 
 try:
     from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
     from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
     import aiohttp
-    from bs4 import BeautifulSoup
+    from aiohttp import web
+    from telegram.error import RetryAfter
+    from telegram.helpers import escape_markdown
+    from bs4 import BeautifulSoup, SoupStrainer
     HAVE_ALL_DEPS = True
 except ImportError as e:
     print(f"❌ Отсутствуют необходимые библиотеки: {e}")
@@ -17,6 +33,20 @@ except ImportError as e:
     print("pip install python-telegram-bot aiohttp beautifulsoup4")
     HAVE_ALL_DEPS = False
 
+# Необязательный быстрый парсер HTML
+try:
+    import lxml  # noqa: F401
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+# Необязательные векторные операции над ценами лотов
+try:
+    import numpy as np
+    HAVE_NUMPY = True
+except ImportError:
+    HAVE_NUMPY = False
+
 # Настройка логирования
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -33,11 +63,574 @@ class UserSettings:
     keywords: List[str] = field(default_factory=list)
     min_price: float = 0
     max_price: float = float('inf')
-    monitored_lots: Dict[str, datetime] = field(default_factory=dict)
 
 # Хранилище настроек пользователей
 user_settings: Dict[int, UserSettings] = {}
 
+# Пользователи с включенным мониторингом
+monitored_users: Set[int] = set()
+
+class Lot:
+    """Лот категории FunPay (слоты вместо словаря: на больших страницах заметно меньше памяти)"""
+    
+    __slots__ = ('title', 'price_text', 'price_value', 'link', 'category_url', 'lot_key', 'offer_id', 'old_price')
+    
+    def __init__(self, title: str, price_text: str, price_value: Optional[float], link: str,
+                 category_url: str, lot_key: int, offer_id: Optional[str], old_price: Optional[float] = None):
+        self.title = title
+        self.price_text = price_text
+        self.price_value = price_value
+        self.link = link
+        self.category_url = category_url
+        self.lot_key = lot_key
+        self.offer_id = offer_id
+        # Прежняя цена, если лот попал в уведомление из-за снижения цены
+        self.old_price = old_price
+    
+    def with_old_price(self, old_price: Optional[float]) -> 'Lot':
+        return Lot(self.title, self.price_text, self.price_value, self.link,
+                   self.category_url, self.lot_key, self.offer_id, old_price)
+    
+    def __repr__(self) -> str:
+        return f"Lot({self.lot_key}, {self.title!r}, {self.price_value})"
+
+class LotBatch:
+    """Лоты страницы с ценами в отдельном массиве: фильтр по цене и сортировка
+    выполняются над массивом целиком (через NumPy, если он установлен)"""
+    
+    def __init__(self, lots: List[Lot]):
+        self.lots = lots
+        # Лоты без цены хранятся как NaN
+        prices = [nan if lot.price_value is None else lot.price_value for lot in lots]
+        self.prices = np.array(prices, dtype=np.float64) if HAVE_NUMPY else array('d', prices)
+        self._titles: Optional[List[str]] = None
+    
+    def __len__(self) -> int:
+        return len(self.lots)
+    
+    def __iter__(self):
+        return iter(self.lots)
+    
+    @property
+    def titles(self) -> List[str]:
+        """Названия в нижнем регистре (считаются один раз на страницу)"""
+        if self._titles is None:
+            self._titles = [lot.title.lower() for lot in self.lots]
+        return self._titles
+    
+    def in_price_range(self, min_price: float, max_price: float) -> List[int]:
+        """Номера лотов с ценой в диапазоне; лоты без цены проходят, как в price_in_range"""
+        if HAVE_NUMPY:
+            prices = self.prices
+            mask = np.isnan(prices) | ((prices >= min_price) & (prices <= max_price))
+            return np.flatnonzero(mask).tolist()
+        return [index for index, price in enumerate(self.prices)
+                if price != price or min_price <= price <= max_price]
+    
+    def filter(self, settings: UserSettings) -> List[Lot]:
+        """Лоты, подходящие под ключевые слова и диапазон цен пользователя"""
+        keywords = [keyword.lower() for keyword in settings.keywords]
+        titles = self.titles
+        return [self.lots[index] for index in self.in_price_range(settings.min_price, settings.max_price)
+                if any(keyword in titles[index] for keyword in keywords)]
+    
+    def cheapest(self, limit: Optional[int] = None) -> List[Lot]:
+        """Лоты по возрастанию цены (без цены - в конце), не больше limit"""
+        count = len(self.lots)
+        limit = count if limit is None else min(limit, count)
+        if HAVE_NUMPY:
+            keys = np.where(np.isnan(self.prices), np.inf, self.prices)
+            if limit < count:
+                # Сначала отбираем limit самых дешевых, сортируем только их
+                order = np.argpartition(keys, limit)[:limit]
+                order = order[np.argsort(keys[order], kind='stable')]
+            else:
+                order = np.argsort(keys, kind='stable')
+            return [self.lots[index] for index in order.tolist()]
+        keys = [inf if price != price else price for price in self.prices]
+        return [self.lots[index] for index in heapq.nsmallest(limit, range(count), key=keys.__getitem__)]
+
+@dataclass
+class CategoryPage:
+    """Кэш последней загруженной страницы категории"""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    body_hash: Optional[bytes] = None
+    lots: List[Lot] = field(default_factory=list)
+    # Лоты страницы в виде пакета для /find (перестраивается при замене списка лотов)
+    lot_batch: Optional[LotBatch] = field(default=None, repr=False)
+    # Версия содержимого растет при каждом изменении страницы
+    version: int = 0
+    # Версия и временная корзина, с которыми страница последний раз сверялась с просмотренными лотами
+    seen_version: int = 0
+    seen_bucket: int = -1
+    # Лоты категории уже сверялись с просмотренными (флаг первой страницы)
+    seeded: bool = False
+    # Цены лотов категории при прошлом сравнении (по ключу лота) и версии страниц, с которых он снят;
+    # снимок общий для всех страниц и хранится у первой
+    snapshot: Dict[int, Optional[float]] = field(default_factory=dict)
+    snapshot_version: Tuple[int, ...] = ()
+    # Следующие страницы категории по номеру (кэшируются так же, как первая)
+    extra_pages: Dict[int, 'CategoryPage'] = field(default_factory=dict, repr=False)
+
+    def batch(self) -> LotBatch:
+        if self.lot_batch is None or self.lot_batch.lots is not self.lots:
+            self.lot_batch = LotBatch(self.lots)
+        return self.lot_batch
+
+# Кэш страниц категорий по URL
+category_pages: Dict[str, CategoryPage] = {}
+
+MONITOR_INTERVAL = 600  # Начальный интервал опроса категории, секунд
+MONITOR_MIN_INTERVAL = 60  # Минимальный интервал опроса категории, секунд
+MONITOR_MAX_INTERVAL = 1800  # Максимальный интервал опроса категории, секунд
+MONITOR_TARGET_NEW_LOTS = 1  # Сколько новых лотов в среднем ожидать за один опрос
+MONITOR_RATE_SMOOTHING = 0.3  # Вес последнего опроса при сглаживании частоты новых лотов
+MONITOR_MAX_FETCH_RATE = 2.0  # Общий лимит загрузок категорий, в секунду
+MONITOR_FETCH_CONCURRENCY = 10  # Сколько категорий загружать одновременно
+MONITOR_TICK = 5  # Как часто планировщик проверяет, какие категории пора опросить, секунд
+MONITOR_FIRST_DELAY = 5  # Задержка перед первым циклом, секунд
+
+# Обход нескольких страниц категории
+CATEGORY_MAX_PAGES = 1  # Сколько страниц категории загружать за опрос (1 - только первую)
+CATEGORY_PAGE_PARAM = 'page'  # Параметр номера страницы в URL категории
+CATEGORY_PAGE_CONCURRENCY = 3  # Сколько следующих страниц загружать одновременно
+
+# Распределение опроса категорий по процессам-сборщикам
+SHARD_WORKERS = 0  # Сколько сборщиков запускать (0 - бот сам опрашивает категории)
+SHARD_HEARTBEAT_TIMEOUT = 30  # Через сколько секунд без отметки сборщик считается выбывшим
+SHARD_RING_REPLICAS = 64  # Точек на кольце консистентного хэширования на одного сборщика
+SHARD_QUEUE_BATCH = 200  # Сколько записей очереди лотов бот забирает за раз
+
+DB_PATH = 'funpay_bot.sqlite3'  # Файл базы с настройками пользователей и просмотренными лотами
+SEEN_LOTS_TTL = 7 * 24 * 3600  # Сколько помнить просмотренные лоты, секунд
+SEEN_BUCKET_SPAN = 24 * 3600  # Ширина временной корзины просмотренных лотов, секунд
+DB_BUSY_TIMEOUT = 10  # Сколько ждать снятия блокировки базы другим процессом, секунд
+
+# Параметры HTTP-клиента для запросов к FunPay
+HTTP_TIMEOUT = 15  # Общий таймаут запроса, секунд
+HTTP_CONNECT_TIMEOUT = 5  # Таймаут установки соединения, секунд
+HTTP_LIMIT = 100  # Максимум одновременных соединений
+HTTP_LIMIT_PER_HOST = 10  # Максимум одновременных соединений к одному хосту
+HTTP_DNS_CACHE_TTL = 300  # Время жизни DNS-кэша, секунд
+HTTP_KEEPALIVE_TIMEOUT = 60  # Время жизни простаивающего соединения, секунд
+
+FIND_CONCURRENCY = 5  # Сколько категорий /find загружает одновременно
+FIND_CACHE_TTL = 60  # Сколько лоты категории в кэше считаются свежими, секунд
+FIND_CACHE_MAX_STALE = 900  # До какого возраста устаревшие лоты отдаются сразу с обновлением в фоне, секунд
+FIND_CACHE_SIZE = 500  # Сколько категорий держать в кэше лотов
+
+# Ограничения Telegram и параметры очереди уведомлений
+TELEGRAM_GLOBAL_RATE = 30  # Сообщений в секунду от бота суммарно
+TELEGRAM_CHAT_RATE = 1  # Сообщений в секунду в один чат
+NOTIFY_WORKERS = 4  # Количество задач, отправляющих уведомления
+NOTIFY_LOTS_PER_MESSAGE = 10  # Сколько лотов объединять в одно сообщение
+NOTIFY_MAX_PENDING_PER_CHAT = 100  # Сколько лотов держать в очереди одного чата
+MESSAGE_MAX_LENGTH = 4096  # Максимальная длина сообщения Telegram
+RENDER_CACHE_SIZE = 10000  # Сколько отформатированных лотов хранить для повторной отправки
+
+# Прием обновлений Telegram
+WEBHOOK_URL = None  # Публичный HTTPS-адрес бота, например 'https://bot.example.com' (None - long polling)
+WEBHOOK_LISTEN = '127.0.0.1'  # Адрес локального сервера вебхука (за обратным прокси)
+WEBHOOK_PORT = 8443  # Порт локального сервера вебхука
+WEBHOOK_PATH = 'telegram-webhook'  # Секретный путь вебхука; замените на случайную строку
+WEBHOOK_SECRET_TOKEN = None  # Секрет в заголовке X-Telegram-Bot-Api-Secret-Token (None - не проверять)
+UPDATE_CONCURRENCY = 32  # Сколько обновлений обрабатывать одновременно
+ALLOWED_UPDATES = ['message']  # Типы обновлений, которые обрабатывают наши обработчики
+
+# Метрики и администрирование
+METRICS_HOST = '127.0.0.1'  # Адрес HTTP-эндпоинта метрик в формате Prometheus
+METRICS_PORT = 9108  # Порт эндпоинта метрик (None - не запускать)
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Границы гистограмм, секунд
+ADMIN_IDS: Set[int] = set()  # Telegram ID администраторов, которым доступна команда /stats
+
+PARSER_BACKEND = None  # Бэкенд разбора HTML: 'lxml', 'html.parser' или None (выбрать автоматически)
+PARSE_WORKERS = 2  # Процессов для разбора страниц (0 - разбирать в основном процессе)
+PARSE_MAX_IN_FLIGHT = 4  # Сколько страниц одновременно отдавать на разбор
+
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+}
+
+# Общая HTTP-сессия приложения (создается в post_init, закрывается в post_shutdown)
+http_session: Optional['aiohttp.ClientSession'] = None
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными границами корзин"""
+    
+    __slots__ = ('counts', 'total', 'count')
+    
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        index = 0
+        while index < len(METRICS_BUCKETS) and value > METRICS_BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+    
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля сверху: граница корзины, в которую он попадает"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bound in enumerate(METRICS_BUCKETS):
+            cumulative += self.counts[index]
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+class Metrics:
+    """Счетчики, показатели и гистограммы работы бота.
+    
+    Метрики различаются именем и набором меток; отдаются в текстовом формате
+    Prometheus и в сводке команды /stats.
+    """
+    
+    def __init__(self):
+        self.started = time.time()
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+    
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]):
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+    
+    def set_gauge(self, name: str, value: float, **labels):
+        self.gauges[self._key(name, labels)] = value
+    
+    def observe(self, name: str, seconds: float, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+    
+    def forget(self, label: str, value: str):
+        """Удаление всех метрик с заданным значением метки (например, отписанной категории)"""
+        for series in (self.counters, self.gauges, self.histograms):
+            for key in [key for key in series if (label, value) in key[1]]:
+                del series[key]
+    
+    @staticmethod
+    def _escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    
+    def merged(self, name: str, **labels) -> Histogram:
+        """Гистограмма метрики, объединенная по всем сериям с заданными метками"""
+        wanted = self._key(name, labels)[1]
+        result = Histogram()
+        for (metric, series_labels), histogram in self.histograms.items():
+            if metric == name and all(label in series_labels for label in wanted):
+                result.counts = [a + b for a, b in zip(result.counts, histogram.counts)]
+                result.total += histogram.total
+                result.count += histogram.count
+        return result
+    
+    def counter_by(self, name: str, label: str) -> Dict[str, float]:
+        """Сумма счетчика по значениям одной метки"""
+        result: Dict[str, float] = {}
+        for (metric, labels), value in self.counters.items():
+            if metric == name:
+                key = dict(labels).get(label, '')
+                result[key] = result.get(key, 0) + value
+        return result
+    
+    def render(self) -> str:
+        """Текстовый формат Prometheus"""
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ''
+            return '{' + ','.join(f'{label}="{self._escape(value)}"' for label, value in items) + '}'
+        
+        lines = []
+        declared = set()
+        
+        def declare(name: str, kind: str):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+        
+        for (name, labels), value in sorted(self.counters.items()):
+            declare(name, 'counter')
+            lines.append(f'{name}{fmt(labels)} {value:g}')
+        for (name, labels), value in sorted(self.gauges.items()):
+            declare(name, 'gauge')
+            lines.append(f'{name}{fmt(labels)} {value:g}')
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(METRICS_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{fmt(labels, [("le", f"{bound:g}")])} {cumulative}')
+            lines.append(f'{name}_bucket{fmt(labels, [("le", "+Inf")])} {histogram.count}')
+            lines.append(f'{name}_sum{fmt(labels)} {histogram.total:.6f}')
+            lines.append(f'{name}_count{fmt(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+# Метрики бота
+metrics = Metrics()
+
+class Storage:
+    """Хранилище настроек пользователей и просмотренных лотов в SQLite (WAL).
+    
+    Изменения копятся в памяти и записываются одной транзакцией за цикл мониторинга,
+    просмотренные лоты проверяются по базе только при первой встрече после запуска.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        # Отдельные соединения для чтения в цикле событий и для записи в фоновом потоке
+        self.reader = self._connect()
+        self.writer = self._connect()
+        self.writer.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                categories TEXT NOT NULL,
+                keywords TEXT NOT NULL,
+                min_price REAL NOT NULL,
+                max_price REAL NOT NULL,
+                monitoring INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS seen_offers (
+                lot_key INTEGER PRIMARY KEY,
+                seen_at INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS seen_offers_seen_at ON seen_offers (seen_at);
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS lot_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                category_url TEXT NOT NULL,
+                lots TEXT NOT NULL
+            );
+        """)
+        self.dirty_users: Set[int] = set()
+        self.pending_seen: List[Tuple[int, int]] = []
+        self.pending_lots: List[Tuple[str, str]] = []
+        self.flush_lock = asyncio.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute(f'PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def load_users(self) -> Tuple[Dict[int, UserSettings], Set[int]]:
+        """Загрузка настроек всех пользователей (без просмотренных лотов)"""
+        settings: Dict[int, UserSettings] = {}
+        monitoring: Set[int] = set()
+        rows = self.reader.execute(
+            'SELECT user_id, categories, keywords, min_price, max_price, monitoring FROM users')
+        for user_id, categories, keywords, min_price, max_price, is_monitoring in rows:
+            settings[user_id] = UserSettings(
+                categories=json.loads(categories),
+                keywords=json.loads(keywords),
+                min_price=min_price,
+                max_price=max_price,
+            )
+            if is_monitoring:
+                monitoring.add(user_id)
+        return settings, monitoring
+    
+    def lookup_seen(self, keys: List[int]) -> Set[int]:
+        """Ключи из списка, уже просмотренные до перезапуска и еще не устаревшие"""
+        found: Set[int] = set()
+        expire_before = time.time() - SEEN_LOTS_TTL
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.reader.execute(
+                f'SELECT lot_key FROM seen_offers WHERE lot_key IN ({placeholders}) AND seen_at >= ?',
+                (*chunk, expire_before))
+            found.update(lot_key for lot_key, in rows)
+        return found
+    
+    def mark_dirty(self, user_id: int):
+        """Пометка настроек пользователя для записи в следующем цикле"""
+        self.dirty_users.add(user_id)
+    
+    def record_seen(self, keys: Iterable[int], seen_at: int):
+        self.pending_seen.extend((lot_key, seen_at) for lot_key in keys)
+    
+    def queue_lots(self, url: str, lots: List[Lot]):
+        """Новые лоты категории для передачи боту (в режиме сборщика)"""
+        records = [[getattr(lot, name) for name in QUEUE_RECORD_FIELDS] for lot in lots]
+        self.pending_lots.append((url, json.dumps(records, ensure_ascii=False)))
+    
+    async def take_lots(self, limit: int) -> List[Tuple[str, str]]:
+        """Извлечение из очереди лотов, переданных сборщиками"""
+        async with self.flush_lock:
+            return await asyncio.to_thread(self._take_lots, limit)
+    
+    def _take_lots(self, limit: int) -> List[Tuple[str, str]]:
+        with self.writer:
+            rows = self.writer.execute(
+                'SELECT id, category_url, lots FROM lot_queue ORDER BY id LIMIT ?', (limit,)).fetchall()
+            if rows:
+                self.writer.execute('DELETE FROM lot_queue WHERE id <= ?', (rows[-1][0],))
+        return [(url, lots) for _, url, lots in rows]
+    
+    def monitored_categories(self) -> Set[str]:
+        """Категории пользователей с включенным мониторингом и ключевыми словами"""
+        urls: Set[str] = set()
+        rows = self.reader.execute("SELECT categories FROM users WHERE monitoring = 1 AND keywords != '[]'")
+        for categories, in rows:
+            urls.update(json.loads(categories))
+        return urls
+    
+    async def heartbeat(self, worker_id: str, now: float):
+        """Отметка сборщика о том, что он работает; давно выбывшие сборщики удаляются"""
+        async with self.flush_lock:
+            await asyncio.to_thread(self._heartbeat, worker_id, now)
+    
+    def _heartbeat(self, worker_id: str, now: float):
+        with self.writer:
+            self.writer.execute('INSERT OR REPLACE INTO workers (worker_id, heartbeat) VALUES (?, ?)',
+                                (worker_id, now))
+            self.writer.execute('DELETE FROM workers WHERE heartbeat < ?', (now - 10 * SHARD_HEARTBEAT_TIMEOUT,))
+    
+    def live_workers(self, since: float) -> Set[str]:
+        rows = self.reader.execute('SELECT worker_id FROM workers WHERE heartbeat >= ?', (since,))
+        return {worker_id for worker_id, in rows}
+    
+    def remove_worker(self, worker_id: str):
+        with self.writer:
+            self.writer.execute('DELETE FROM workers WHERE worker_id = ?', (worker_id,))
+    
+    async def flush(self):
+        """Запись накопленных изменений одной транзакцией"""
+        async with self.flush_lock:
+            if not self.dirty_users and not self.pending_seen and not self.pending_lots:
+                return
+            upserts, deletes = [], []
+            for user_id in self.dirty_users:
+                settings = user_settings.get(user_id)
+                if settings is None:
+                    deletes.append((user_id,))
+                else:
+                    upserts.append((
+                        user_id,
+                        json.dumps(settings.categories, ensure_ascii=False),
+                        json.dumps(settings.keywords, ensure_ascii=False),
+                        settings.min_price,
+                        settings.max_price,
+                        int(user_id in monitored_users),
+                    ))
+            seen, self.pending_seen = self.pending_seen, []
+            queued, self.pending_lots = self.pending_lots, []
+            dirty, self.dirty_users = self.dirty_users, set()
+            expire_before = time.time() - SEEN_LOTS_TTL
+            write = asyncio.ensure_future(
+                asyncio.to_thread(self._write, upserts, deletes, seen, queued, expire_before))
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # Поток записи не прервать: дожидаемся его, не отпуская блокировку, и только потом отменяемся
+                await asyncio.wait([write])
+                raise
+            finally:
+                if write.done() and write.exception() is not None:
+                    # Транзакция откатилась: возвращаем изменения, чтобы записать их в следующем цикле
+                    self.dirty_users |= dirty
+                    self.pending_seen[:0] = seen
+                    self.pending_lots[:0] = queued
+    
+    def _write(self, upserts, deletes, seen, queued, expire_before: float):
+        with self.writer:
+            self.writer.executemany(
+                'INSERT OR REPLACE INTO users (user_id, categories, keywords, min_price, max_price, monitoring) '
+                'VALUES (?, ?, ?, ?, ?, ?)', upserts)
+            self.writer.executemany('DELETE FROM users WHERE user_id = ?', deletes)
+            self.writer.executemany(
+                'INSERT OR REPLACE INTO seen_offers (lot_key, seen_at) VALUES (?, ?)', seen)
+            self.writer.execute('DELETE FROM seen_offers WHERE seen_at < ?', (expire_before,))
+            self.writer.executemany('INSERT INTO lot_queue (category_url, lots) VALUES (?, ?)', queued)
+    
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+# Постоянное хранилище (открывается в post_init)
+storage: Optional[Storage] = None
+
+class SeenLots:
+    """Общие для всех пользователей просмотренные лоты с истечением по временным корзинам.
+    
+    Каждый ключ хранится один раз вместе с номером корзины, в которой он встречался
+    последним, и лежит в компактном массиве 64-битных ключей одной корзины. Повторная
+    встреча меняет только номер корзины; при истечении корзины ее ключи, встреченные
+    с тех пор, переносятся в массив своей последней корзины, а остальные удаляются.
+    """
+    
+    def __init__(self, ttl: int = SEEN_LOTS_TTL, bucket_span: int = SEEN_BUCKET_SPAN):
+        self.bucket_span = bucket_span
+        self.bucket_count = max(1, ttl // bucket_span)
+        # Ключ лота -> номер корзины, в которой он встречался последним
+        self.last_bucket: Dict[int, int] = {}
+        self.buckets: Deque[Tuple[int, array]] = deque()
+    
+    def current_bucket(self) -> int:
+        """Номер текущей корзины; заодно отбрасываются устаревшие"""
+        bucket = int(time.time() // self.bucket_span)
+        if not self.buckets or self.buckets[-1][0] != bucket:
+            self.buckets.append((bucket, array('q')))
+            while self.buckets[0][0] <= bucket - self.bucket_count:
+                self._expire(*self.buckets.popleft())
+        # Один объект номера корзины на все ключи, отмеченные в ней
+        return self.buckets[-1][0]
+    
+    def _expire(self, expired: int, keys: array):
+        last_bucket = self.last_bucket
+        arrays = dict(self.buckets)
+        for key in keys:
+            bucket = last_bucket.get(key)
+            if bucket == expired:
+                del last_bucket[key]
+            elif bucket is not None:
+                arrays[bucket].append(key)
+    
+    def __contains__(self, key: int) -> bool:
+        return key in self.last_bucket
+    
+    def __len__(self) -> int:
+        return len(self.last_bucket)
+    
+    def mark(self, keys: Iterable[int]) -> List[int]:
+        """Отметка ключей в текущей корзине; возвращает ключи, которых в ней еще не было"""
+        bucket = self.current_bucket()
+        last_bucket = self.last_bucket
+        current = self.buckets[-1][1]
+        added = []
+        for key in keys:
+            previous = last_bucket.get(key)
+            if previous == bucket:
+                continue
+            last_bucket[key] = bucket
+            if previous is None:
+                current.append(key)
+            added.append(key)
+        return added
+
+# Просмотренные лоты всех категорий
+seen_lots = SeenLots()
+
 def extract_price(price_text: str) -> Optional[float]:
     """Извлечение числа из строки с ценой"""
     if not price_text:
@@ -86,6 +679,7 @@ async def handle_category_link(update: Update, context: ContextTypes.DEFAULT_TYP
     
     if url not in user_settings[user_id].categories:
         user_settings[user_id].categories.append(url)
+        on_settings_changed(user_id)
         await update.message.reply_text(
             f"✅ Категория добавлена!\n"
             f"📁 Ссылка: {url}\n\n"
@@ -123,6 +717,7 @@ async def set_keywords(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     user_settings[user_id].keywords = keywords
+    on_settings_changed(user_id)
     
     max_price = user_settings[user_id].max_price
     max_price_display = f"{max_price:.2f}" if max_price != float('inf') else "∞"
@@ -161,6 +756,7 @@ async def set_price_range(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.args[0].lower() == 'reset':
         user_settings[user_id].min_price = 0
         user_settings[user_id].max_price = float('inf')
+        on_settings_changed(user_id)
         await update.message.reply_text("✅ Фильтр цены сброшен")
         return
     
@@ -183,6 +779,8 @@ async def set_price_range(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_settings[user_id].min_price = min_price
             user_settings[user_id].max_price = max_price
         
+        on_settings_changed(user_id)
+        
         max_price_display = user_settings[user_id].max_price
         if max_price_display == float('inf'):
             max_price_display = '∞'
@@ -204,104 +802,604 @@ async def set_price_range(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except ValueError:
         await update.message.reply_text("❌ Пожалуйста, укажите корректные числа для цен")
 
-async def parse_funpay_category(url: str, settings: UserSettings) -> List[Dict[str, Any]]:
-    """Парсинг категории FunPay"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-    }
+def get_http_session() -> 'aiohttp.ClientSession':
+    """Общая HTTP-сессия с keep-alive, DNS-кэшем и лимитами соединений"""
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        http_session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HTTP_HEADERS)
+    return http_session
+
+async def close_http_session():
+    """Закрытие общей HTTP-сессии"""
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+def page_fingerprint(body: bytes) -> bytes:
+    """Быстрый отпечаток тела страницы"""
+    # Шапка страницы содержит меняющиеся при каждом запросе данные (csrf-токен и т.п.),
+    # поэтому хэшируем часть страницы начиная с первого лота
+    start = body.find(b'tc-item')
+    if start > 0:
+        body = body[start:]
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+@dataclass(frozen=True)
+class ParserBackend:
+    """Бэкенд разбора HTML для BeautifulSoup"""
+    name: str
+    features: str
+    
+    def parse(self, html: str, only_lots: bool = False) -> 'BeautifulSoup':
+        """Разбор страницы; при only_lots строится дерево только для контейнеров лотов"""
+        parse_only = SoupStrainer(class_='tc-item') if only_lots else None
+        return BeautifulSoup(html, self.features, parse_only=parse_only)
+
+def available_parser_backends() -> List[ParserBackend]:
+    """Доступные бэкенды разбора HTML, от быстрого к медленному"""
+    backends = []
+    if HAVE_LXML:
+        backends.append(ParserBackend('lxml', 'lxml'))
+    backends.append(ParserBackend('html.parser', 'html.parser'))
+    return backends
+
+def select_parser_backend(name: Optional[str] = None) -> ParserBackend:
+    """Выбор бэкенда по имени или самого быстрого из доступных"""
+    backends = available_parser_backends()
+    for backend in backends:
+        if name is None or backend.name == name:
+            return backend
+    logger.warning(f"Парсер {name} недоступен, используется {backends[-1].name}")
+    return backends[-1]
+
+parser_backend = select_parser_backend(PARSER_BACKEND)
+
+# Поиск лотов - ВАЖНО: нужно адаптировать под конкретную структуру FunPay
+# Пробуем разные варианты селекторов
+LOT_SELECTORS = [
+    {'tag': 'div', 'class': 'tc-item'},
+    {'tag': 'a', 'class': 'tc-item'},
+    {'tag': 'div', 'class': 'lot-item'},
+    {'tag': 'div', 'class': 'item'},
+    {'tag': 'div', 'class_contains': 'item'},  # class содержит "item"
+]
+
+# Селекторы названия и цены в порядке приоритета: (css, тег, класс, подстрока в class, атрибут)
+TITLE_SELECTORS = [
+    ('div.tc-desc-text', 'div', 'tc-desc-text', None, None),
+    ('div.item-title', 'div', 'item-title', None, None),
+    ('div.title', 'div', 'title', None, None),
+    ('h5', 'h5', None, None, None),
+    ('h4', 'h4', None, None, None),
+    ('h3', 'h3', None, None, None),
+    ('a[href]', 'a', None, None, 'href'),
+]
+
+PRICE_SELECTORS = [
+    ('div.tc-price', 'div', 'tc-price', None, None),
+    ('div.price', 'div', 'price', None, None),
+    ('span.price', 'span', 'price', None, None),
+    ('div.item-price', 'div', 'item-price', None, None),
+    ('b', 'b', None, None, None),
+    ('strong', 'strong', None, None, None),
+    ('[class*="price"]', None, None, 'price', None),
+    ('[class*="cost"]', None, None, 'cost', None),
+]
+
+OFFER_ID_RE = re.compile(r'[?&]id=([\w-]+)')
+
+class SelectorRules:
+    """Набор селекторов, проверяемых за один проход по дереву лота"""
     
-    found_lots = []
+    def __init__(self, selectors, min_length: int = 1):
+        self.selectors = selectors
+        self.min_length = min_length
+        self.by_tag: Dict[str, List[int]] = {}
+        self.any_tag: List[int] = []
+        for index, (_, tag, _, _, _) in enumerate(selectors):
+            if tag:
+                self.by_tag.setdefault(tag, []).append(index)
+            else:
+                self.any_tag.append(index)
     
+    def match(self, index: int, tag, classes: List[str]) -> bool:
+        """Проверка элемента на соответствие селектору"""
+        _, _, class_name, class_part, attr = self.selectors[index]
+        if class_name and class_name not in classes:
+            return False
+        if class_part and class_part not in ' '.join(classes):
+            return False
+        if attr and not tag.get(attr):
+            return False
+        return True
+    
+    def qualifies(self, text: Optional[str]) -> bool:
+        return bool(text) and len(text) >= self.min_length
+    
+    def pick(self, texts: List[Optional[str]], learned: Optional[int]) -> Tuple[Optional[str], Optional[int]]:
+        """Текст по выученному селектору, иначе по первому сработавшему в порядке приоритета"""
+        if learned is not None and self.qualifies(texts[learned]):
+            return texts[learned], learned
+        text = None
+        for index, candidate in enumerate(texts):
+            if candidate is None:
+                continue
+            text = candidate
+            if self.qualifies(candidate):
+                return candidate, index
+        return text, None
+    
+    def settled(self, texts: List[Optional[str]], learned: Optional[int]) -> bool:
+        """Результат уже не изменится при дальнейшем обходе"""
+        if learned is not None and self.qualifies(texts[learned]):
+            return True
+        for candidate in texts:
+            if candidate is None:
+                return False
+            if self.qualifies(candidate):
+                return True
+        return True
+
+title_rules = SelectorRules(TITLE_SELECTORS, min_length=4)
+price_rules = SelectorRules(PRICE_SELECTORS)
+
+@dataclass
+class ExtractionProfile:
+    """Селекторы, сработавшие на странице категории в прошлый раз"""
+    container: Dict[str, str]
+    title_rule: Optional[int] = None
+    price_rule: Optional[int] = None
+
+# Выученные профили извлечения по URL категории
+extraction_profiles: Dict[str, ExtractionProfile] = {}
+
+def selector_label(selector: Dict[str, str]) -> str:
+    """Короткое название селектора контейнера для метрик"""
+    if 'class_contains' in selector:
+        return f"{selector['tag']}[class*={selector['class_contains']}]"
+    return f"{selector['tag']}.{selector['class']}"
+
+def find_lot_elements(soup, selector: Dict[str, str]) -> list:
+    """Поиск контейнеров лотов по одному селектору"""
+    if 'class_contains' in selector:
+        return soup.find_all(selector['tag'], class_=lambda x: x and selector['class_contains'] in x)
+    return soup.find_all(selector['tag'], class_=selector['class'])
+
+@dataclass
+class ParseResult:
+    """Результат разбора страницы: лоты, выученный профиль и замеры для метрик"""
+    lots: list
+    profile: Optional[ExtractionProfile]
+    selector: str
+    parse_seconds: float
+    extract_seconds: float
+
+def parse_lots(html: str, url: str, profile: Optional[ExtractionProfile] = None,
+               page_url: Optional[str] = None) -> ParseResult:
+    """Разбор HTML страницы категории без обращения к общему состоянию бота.
+    
+    page_url задается для страниц после первой: он попадает в журнал, а профиль
+    категории на такой странице не подбирается заново (за последней страницей
+    лотов просто нет).
+    """
+    # Одна строка URL на все лоты страницы и все загрузки категории
+    url = sys.intern(url)
+    source = page_url or url
+    lots = []
+    started = time.perf_counter()
+    
+    # Полное дерево: по замерам benchmarks/bench_parsers.py разбор только контейнеров tc-item
+    # (SoupStrainer) не быстрее, а страницы без них пришлось бы разбирать повторно
+    soup = parser_backend.parse(html)
+    
+    # Если профиль категории уже выучен, сразу используем его селектор
+    lot_elements = []
+    if profile:
+        lot_elements = find_lot_elements(soup, profile.container)
+        if not lot_elements and not page_url:
+            logger.info(f"Профиль извлечения для {url} устарел, подбираем заново")
+            profile = None
+    
+    if not profile:
+        for selector in LOT_SELECTORS:
+            lot_elements = find_lot_elements(soup, selector)
+            if lot_elements:
+                logger.info(f"Найдено {len(lot_elements)} лотов с селектором {selector}")
+                profile = ExtractionProfile(container=selector)
+                break
+    
+    if lot_elements:
+        selector_name = selector_label(profile.container)
+    elif page_url and profile:
+        logger.debug(f"Нет лотов на странице {source}")
+        selector_name = 'none'
+    else:
+        logger.warning(f"Не найдено лотов на странице: {source}")
+        # Пробуем найти любые элементы, которые могут быть лотами
+        lot_elements = soup.find_all(['div', 'a'], class_=True)
+        lot_elements = [el for el in lot_elements if any(word in str(el.get('class', [])).lower() 
+                                                        for word in ['item', 'lot', 'product', 'offer'])]
+        selector_name = 'generic' if lot_elements else 'none'
+    
+    parsed = time.perf_counter()
+    
+    for element in lot_elements:
+        try:
+            lot_data = extract_lot_data(element, url, profile)
+            if lot_data:
+                lots.append(lot_data)
+        except Exception as e:
+            logger.debug(f"Ошибка обработки лота: {e}")
+            continue
+    
+    return ParseResult(lots, profile, selector_name, parsed - started, time.perf_counter() - parsed)
+
+def record_parse(url: str, result: ParseResult, first_page: bool = True):
+    """Сохранение выученного профиля и метрик разбора в основном процессе.
+    
+    Профиль и выбранный селектор учитываются только по первой странице категории.
+    """
+    if first_page:
+        if result.profile:
+            extraction_profiles[url] = result.profile
+        metrics.inc('funpay_selector_total', category=url, selector=result.selector)
+    metrics.observe('funpay_stage_seconds', result.parse_seconds, stage='parse', category=url)
+    metrics.observe('funpay_stage_seconds', result.extract_seconds, stage='extract', category=url)
+    metrics.inc('funpay_lots_parsed_total', len(result.lots), category=url)
+
+def parse_category_html(html: str, url: str) -> List[Lot]:
+    """Разбор HTML страницы категории в список лотов"""
+    result = parse_lots(html, url, extraction_profiles.get(url))
+    record_parse(url, result)
+    return result.lots
+
+# Поля лота, которые процесс разбора передает обратно в компактном виде
+LOT_RECORD_FIELDS = ('title', 'price_text', 'price_value', 'link', 'lot_key', 'offer_id')
+
+def init_parse_worker(backend_name: str):
+    """Настройка процесса разбора: тот же бэкенд, что и в основном процессе"""
+    global parser_backend
+    parser_backend = select_parser_backend(backend_name)
+
+def parse_page_records(body: bytes, charset: str, url: str, profile: Optional[ExtractionProfile],
+                       page_url: Optional[str] = None) -> ParseResult:
+    """Разбор страницы в процессе пула; лоты возвращаются кортежами полей LOT_RECORD_FIELDS"""
+    result = parse_lots(body.decode(charset, errors='replace'), url, profile, page_url)
+    result.lots = [tuple(getattr(lot, name) for name in LOT_RECORD_FIELDS) for lot in result.lots]
+    return result
+
+# Поля лота в очереди от сборщиков: для подешевевших лотов передается и прежняя цена
+QUEUE_RECORD_FIELDS = LOT_RECORD_FIELDS + ('old_price',)
+
+def lot_from_record(record: tuple, url: str, fields: Tuple[str, ...] = LOT_RECORD_FIELDS) -> Lot:
+    return Lot(category_url=url, **dict(zip(fields, record)))
+
+# Пул процессов разбора и ограничение числа страниц в работе (создаются при первом разборе)
+parse_pool: Optional[ProcessPoolExecutor] = None
+parse_slots: Optional[asyncio.Semaphore] = None
+
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    global parse_pool
+    if parse_pool is None and PARSE_WORKERS > 0:
+        # spawn: не копируем в дочерние процессы потоки и соединения основного процесса
+        parse_pool = ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_parse_worker,
+            initargs=(parser_backend.name,),
+        )
+    return parse_pool
+
+def close_parse_pool():
+    global parse_pool
+    if parse_pool is not None:
+        parse_pool.shutdown(wait=False, cancel_futures=True)
+        parse_pool = None
+
+async def parse_category_page(body: bytes, charset: str, url: str,
+                              page_url: Optional[str] = None) -> List[Lot]:
+    """Разбор загруженной страницы в пуле процессов (или на месте, если пул отключен).
+    
+    page_url - адрес страницы после первой (см. parse_lots).
+    """
+    global parse_slots
+    pool = get_parse_pool()
+    profile = extraction_profiles.get(url)
+    result = None
+    if pool is not None:
+        if parse_slots is None:
+            parse_slots = asyncio.Semaphore(PARSE_MAX_IN_FLIGHT)
+        async with parse_slots:
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    pool, parse_page_records, body, charset, url, profile, page_url)
+            except BrokenProcessPool:
+                logger.error("Пул процессов разбора аварийно завершился, пересоздаем его")
+                close_parse_pool()
+        if result is not None:
+            url = sys.intern(url)
+            result.lots = [lot_from_record(record, url) for record in result.lots]
+    
+    if result is None:
+        result = parse_lots(body.decode(charset, errors='replace'), url, profile, page_url)
+    record_parse(url, result, first_page=page_url is None)
+    return result.lots
+
+def category_page_url(url: str, page_no: int) -> str:
+    """URL страницы категории с заданным номером"""
+    if page_no == 1:
+        return url
+    separator = '&' if '?' in url else '?'
+    return f"{url}{separator}{CATEGORY_PAGE_PARAM}={page_no}"
+
+async def fetch_category_page(url: str, page_no: int = 1) -> Tuple[CategoryPage, bool, bool]:
+    """Загрузка страницы категории FunPay с условным запросом и кэшем страницы.
+    
+    Возвращает страницу из кэша, признак того, что ее содержимое изменилось, и признак
+    успешной загрузки именно в этом вызове (при ошибке в странице остаются прежние лоты;
+    страницу могут одновременно загружать мониторинг и /find).
+    Профиль извлечения, лоты и метрики всех страниц относятся к URL категории.
+    """
+    page = category_pages.setdefault(url, CategoryPage())
+    if page_no > 1:
+        page = page.extra_pages.setdefault(page_no, CategoryPage())
+    fetch_url = category_page_url(url, page_no)
+    
+    headers = {}
+    if page.etag:
+        headers['If-None-Match'] = page.etag
+    if page.last_modified:
+        headers['If-Modified-Since'] = page.last_modified
+    
+    started = time.perf_counter()
+    fetched = None
+    status = 'error'
     try:
-        timeout = aiohttp.ClientTimeout(total=15)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status != 200:
-                    logger.error(f"HTTP {response.status} для {url}")
-                    return found_lots
-                
-                html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # Поиск лотов - ВАЖНО: нужно адаптировать под конкретную структуру FunPay
-                # Пробуем разные варианты селекторов
-                selectors = [
-                    {'tag': 'div', 'class': 'tc-item'},
-                    {'tag': 'a', 'class': 'tc-item'},
-                    {'tag': 'div', 'class': 'lot-item'},
-                    {'tag': 'div', 'class': 'item'},
-                    {'tag': 'div', 'class_contains': 'item'},  # class содержит "item"
-                ]
-                
-                lot_elements = []
-                for selector in selectors:
-                    if 'class_contains' in selector:
-                        lot_elements = soup.find_all(selector['tag'], 
-                                                   class_=lambda x: x and selector['class_contains'] in x)
-                    else:
-                        lot_elements = soup.find_all(selector['tag'], class_=selector['class'])
-                    
-                    if lot_elements:
-                        logger.info(f"Найдено {len(lot_elements)} лотов с селектором {selector}")
-                        break
-                
-                if not lot_elements:
-                    logger.warning(f"Не найдено лотов на странице: {url}")
-                    # Пробуем найти любые элементы, которые могут быть лотами
-                    lot_elements = soup.find_all(['div', 'a'], class_=True)
-                    lot_elements = [el for el in lot_elements if any(word in str(el.get('class', [])).lower() 
-                                                                    for word in ['item', 'lot', 'product', 'offer'])]
-                
-                for element in lot_elements[:30]:  # Ограничиваем для скорости
-                    try:
-                        # Извлечение данных
-                        lot_data = extract_lot_data(element, url)
-                        if not lot_data:
-                            continue
-                        
-                        # Применение фильтров
-                        if not apply_filters(lot_data, settings):
-                            continue
-                        
-                        found_lots.append(lot_data)
-                        
-                    except Exception as e:
-                        logger.debug(f"Ошибка обработки лота: {e}")
-                        continue
-                
+        session = get_http_session()
+        async with session.get(fetch_url, headers=headers) as response:
+            status = str(response.status)
+            if response.status == 304:
+                return page, False, True
+            
+            if response.status != 200:
+                logger.error(f"HTTP {response.status} для {fetch_url}")
+                return page, False, False
+            
+            body = await response.read()
+            charset = response.charset or 'utf-8'
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+        fetched = time.perf_counter()
+        
+        body_hash = page_fingerprint(body)
+        if body_hash != page.body_hash:
+            page.lots = await parse_category_page(body, charset, url, fetch_url if page_no > 1 else None)
+        
+        page.etag = etag
+        page.last_modified = last_modified
+        if body_hash == page.body_hash:
+            return page, False, True
+        
+        page.body_hash = body_hash
+        page.version += 1
+        return page, True, True
+        
     except asyncio.TimeoutError:
-        logger.error(f"Таймаут при парсинге {url}")
+        status = 'timeout'
+        logger.error(f"Таймаут при парсинге {fetch_url}")
     except Exception as e:
-        logger.error(f"Ошибка парсинга {url}: {e}")
+        logger.error(f"Ошибка парсинга {fetch_url}: {e}")
+    finally:
+        metrics.inc('funpay_fetch_total', category=url, status=status)
+        metrics.observe('funpay_stage_seconds', (fetched or time.perf_counter()) - started,
+                        stage='fetch', category=url)
+    
+    return page, False, False
+
+def all_seen(page: CategoryPage) -> bool:
+    """Все лоты страницы уже встречались (или страница пуста)"""
+    return all(lot.lot_key in seen_lots for lot in page.lots)
+
+async def crawl_category(url: str, monitor: bool = True) -> Tuple[List[CategoryPage], bool]:
+    """Загрузка страниц категории, начиная с первой; возвращает страницы и признак
+    того, что первая страница загрузилась.
+    
+    Следующие страницы загружаются одновременно пачками растущего размера (1, 2, 4...
+    до CATEGORY_PAGE_CONCURRENCY), не дальше CATEGORY_MAX_PAGES. При опросе мониторингом
+    каждая следующая страница ждет токен общего лимита загрузок, а обход прекращается
+    на странице, все лоты которой уже просмотрены: в установившемся режиме это
+    одна-две страницы за опрос. Для /find (monitor=False) загружаются все страницы
+    до последней.
+    """
+    first, _, loaded = await fetch_category_page(url)
+    pages = [first]
+    next_page = 2
+    wave_size = 1
+    while next_page <= CATEGORY_MAX_PAGES and loaded and not (monitor and all_seen(pages[-1])):
+        wave = range(next_page, min(next_page + wave_size, CATEGORY_MAX_PAGES + 1))
+        if monitor:
+            # Дополнительные страницы расходуют общий лимит загрузок мониторинга
+            for _ in wave:
+                await fetch_budget.acquire()
+        results = await asyncio.gather(*(fetch_category_page(url, page_no) for page_no in wave))
+        stop = False
+        for page_no, (page, _, page_loaded) in zip(wave, results):
+            if not page_loaded:
+                stop = True
+                break
+            # Сайт без постраничного вывода отдает на любой номер первую страницу
+            if not page.lots or page.body_hash == first.body_hash:
+                # Страницы за последней больше не нужны: их лоты могли устареть
+                for number in [number for number in first.extra_pages if number >= page_no]:
+                    del first.extra_pages[number]
+                stop = True
+                break
+            pages.append(page)
+            stop = stop or (monitor and all_seen(page))
+        metrics.inc('funpay_extra_pages_total', len(wave), category=url)
+        if stop:
+            break
+        next_page = wave.stop
+        wave_size = min(wave_size * 2, CATEGORY_PAGE_CONCURRENCY)
+    return pages, loaded
+
+def cached_pages(first: CategoryPage) -> List[CategoryPage]:
+    """Первая страница категории и все ее закэшированные следующие страницы по порядку"""
+    return [first] + [first.extra_pages[number] for number in sorted(first.extra_pages)]
+
+def category_lots(first: CategoryPage) -> LotBatch:
+    """Лоты первой страницы категории и всех ее закэшированных следующих страниц без повторов.
+    
+    В кэш попадают и страницы, не загруженные в этом опросе из-за раннего
+    завершения обхода, так что /find видит всю категорию.
+    """
+    if not first.extra_pages:
+        return first.batch()
+    lots: Dict[int, Lot] = {}
+    for page in cached_pages(first):
+        for lot in page.lots:
+            lots.setdefault(lot.lot_key, lot)
+    return LotBatch(list(lots.values()))
+
+async def fetch_category_lots(url: str) -> LotBatch:
+    """Загрузка и разбор категории FunPay без применения фильтров пользователя.
+    
+    Если первую страницу загрузить не удалось, выбрасывает исключение, чтобы
+    в кэш /find не попал пустой результат.
+    """
+    pages, loaded = await crawl_category(url, monitor=False)
+    if not loaded:
+        raise RuntimeError(f"не удалось загрузить категорию {url}")
+    return category_lots(pages[0])
+
+class LotCache:
+    """Кэш неотфильтрованных лотов категорий для /find.
+    
+    Записи живут FIND_CACHE_TTL секунд; более старые (до FIND_CACHE_MAX_STALE) отдаются
+    сразу, а страница перезагружается в фоне. Одновременные запросы одной категории
+    ждут одну общую загрузку. При переполнении вытесняются давно не запрошенные категории.
+    """
+    
+    def __init__(self, ttl: float = FIND_CACHE_TTL, max_stale: float = FIND_CACHE_MAX_STALE,
+                 size: int = FIND_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.size = size
+        self.entries: 'OrderedDict[str, Tuple[LotBatch, float]]' = OrderedDict()
+        self.inflight: Dict[str, asyncio.Task] = {}
+    
+    def put(self, url: str, lots: LotBatch):
+        self.entries[url] = (lots, time.monotonic())
+        self.entries.move_to_end(url)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+    
+    async def get(self, url: str) -> LotBatch:
+        entry = self.entries.get(url)
+        if entry is not None:
+            lots, stored = entry
+            age = time.monotonic() - stored
+            if age <= self.max_stale:
+                self.entries.move_to_end(url)
+                if age <= self.ttl:
+                    metrics.inc('find_cache_total', result='hit')
+                else:
+                    metrics.inc('find_cache_total', result='stale')
+                    self._refresh(url)
+                return lots
+        
+        metrics.inc('find_cache_total', result='shared' if url in self.inflight else 'miss')
+        # shield: отмена одного запроса не должна прерывать общую загрузку
+        return await asyncio.shield(self._refresh(url))
+    
+    def _refresh(self, url: str) -> asyncio.Task:
+        task = self.inflight.get(url)
+        if task is None:
+            task = self.inflight[url] = asyncio.create_task(self._load(url))
+            task.add_done_callback(lambda done: self._loaded(url, done))
+        return task
+    
+    async def _load(self, url: str) -> LotBatch:
+        lots = await fetch_category_lots(url)
+        self.put(url, lots)
+        return lots
     
-    return found_lots
+    def _loaded(self, url: str, task: asyncio.Task):
+        self.inflight.pop(url, None)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Ошибка обновления кэша лотов {url}: {task.exception()}")
+    
+    async def close(self):
+        for task in list(self.inflight.values()):
+            task.cancel()
+        await asyncio.gather(*self.inflight.values(), return_exceptions=True)
+        self.inflight.clear()
+
+# Общий кэш лотов категорий; его наполняют и /find, и мониторинг
+lot_cache = LotCache()
+
+async def parse_funpay_category(url: str, settings: UserSettings) -> List[Lot]:
+    """Парсинг категории FunPay с фильтрами пользователя"""
+    batch = await lot_cache.get(url)
+    started = time.perf_counter()
+    found = batch.filter(settings)
+    metrics.observe('funpay_stage_seconds', time.perf_counter() - started, stage='filter', category=url)
+    return found
 
-def extract_lot_data(element, url: str) -> Optional[Dict[str, Any]]:
-    """Извлечение данных из элемента лота"""
+def make_lot_key(offer_id: Optional[str], fallback: str) -> int:
+    """Стабильный 64-битный ключ лота: номер предложения FunPay или хэш идентификатора"""
+    if offer_id and offer_id.isdigit() and int(offer_id) < 2 ** 63:
+        return int(offer_id)
+    digest = hashlib.blake2b((offer_id or fallback).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def extract_lot_data(element, url: str, profile: Optional[ExtractionProfile] = None) -> Optional[Lot]:
+    """Извлечение данных из элемента лота за один проход по его поддереву"""
     try:
+        title_texts: List[Optional[str]] = [None] * len(TITLE_SELECTORS)
+        price_texts: List[Optional[str]] = [None] * len(PRICE_SELECTORS)
+        title_learned = profile.title_rule if profile else None
+        price_learned = profile.price_rule if profile else None
+        link_elem = None
+        
+        for tag in element.descendants:
+            name = tag.name
+            if name is None:  # текстовый узел
+                continue
+            classes = tag.get('class') or []
+            found = False
+            
+            for rules, texts in ((title_rules, title_texts), (price_rules, price_texts)):
+                for index in rules.by_tag.get(name, ()):
+                    if texts[index] is None and rules.match(index, tag, classes):
+                        texts[index] = tag.get_text(strip=True)
+                        found = True
+                if classes:
+                    for index in rules.any_tag:
+                        if texts[index] is None and rules.match(index, tag, classes):
+                            texts[index] = tag.get_text(strip=True)
+                            found = True
+            
+            if link_elem is None and name == 'a' and tag.get('href'):
+                link_elem = tag
+                found = True
+            
+            # Прекращаем обход, как только лучшие значения уже определены
+            if (found and link_elem is not None
+                    and title_rules.settled(title_texts, title_learned)
+                    and price_rules.settled(price_texts, price_learned)):
+                break
+        
         # Название лота
-        title = None
-        title_selectors = [
-            ('div.tc-desc-text', 'text'),
-            ('div.item-title', 'text'),
-            ('div.title', 'text'),
-            ('h5', 'text'),
-            ('h4', 'text'),
-            ('h3', 'text'),
-            ('a[href]', 'text'),
-        ]
-        
-        for selector, attr in title_selectors:
-            elem = element.select_one(selector)
-            if elem:
-                if attr == 'text':
-                    title = elem.get_text(strip=True)
-                else:
-                    title = elem.get(attr, '')
-                if title and len(title) > 3:
-                    break
+        title, title_rule = title_rules.pick(title_texts, title_learned)
         
         if not title:
             # Пробуем извлечь из всего элемента
@@ -310,72 +1408,60 @@ def extract_lot_data(element, url: str) -> Optional[Dict[str, Any]]:
                 return None
         
         # Цена
-        price_text = None
-        price_selectors = [
-            ('div.tc-price', 'text'),
-            ('div.price', 'text'),
-            ('span.price', 'text'),
-            ('div.item-price', 'text'),
-            ('b', 'text'),
-            ('strong', 'text'),
-            ('[class*="price"]', 'text'),
-            ('[class*="cost"]', 'text'),
-        ]
-        
-        for selector, attr in price_selectors:
-            elem = element.select_one(selector)
-            if elem:
-                if attr == 'text':
-                    price_text = elem.get_text(strip=True)
-                else:
-                    price_text = elem.get(attr, '')
-                if price_text:
-                    break
+        price_text, price_rule = price_rules.pick(price_texts, price_learned)
+        
+        # Запоминаем сработавшие селекторы для следующих лотов категории
+        if profile:
+            if title_rule is not None:
+                profile.title_rule = title_rule
+            if price_rule is not None:
+                profile.price_rule = price_rule
         
         # Ссылка
         link = None
-        link_elem = element.find('a', href=True)
-        if link_elem:
+        if link_elem is not None:
             link = link_elem['href']
         elif element.name == 'a' and element.get('href'):
             link = element['href']
-        else:
-            # Ищем любую ссылку внутри
-            link_elem = element.select_one('a[href]')
-            if link_elem:
-                link = link_elem['href']
         
         if link and not link.startswith('http'):
             link = f"https://funpay.com{link}"
         
+        # Идентификатор предложения FunPay из ссылки вида .../offer?id=123
+        offer_match = OFFER_ID_RE.search(link) if link else None
+        
         # ID лота для отслеживания
-        lot_id = f"{link}_{title[:50]}" if link else title[:100]
-        
-        return {
-            'title': title[:150],
-            'price_text': price_text or "Цена не указана",
-            'price_value': extract_price(price_text) if price_text else None,
-            'link': link or url,  # Если нет ссылки, используем URL категории
-            'category_url': url,
-            'lot_id': lot_id,
-            'timestamp': datetime.now()
-        }
+        offer_id = offer_match.group(1) if offer_match else None
+        lot_key = make_lot_key(offer_id, f"{link}_{title[:50]}" if link else title[:100])
+        
+        return Lot(
+            title=title[:150],
+            price_text=price_text or "Цена не указана",
+            price_value=extract_price(price_text) if price_text else None,
+            link=link or url,  # Если нет ссылки, используем URL категории
+            category_url=url,
+            lot_key=lot_key,
+            offer_id=offer_id,
+        )
         
     except Exception as e:
         logger.debug(f"Ошибка извлечения данных: {e}")
         return None
 
-def apply_filters(lot_data: Dict[str, Any], settings: UserSettings) -> bool:
+def apply_filters(lot: Lot, settings: UserSettings) -> bool:
     """Применение фильтров к лоту"""
     # Фильтр по ключевым словам в названии
-    title_lower = lot_data['title'].lower()
+    title_lower = lot.title.lower()
     keyword_match = any(keyword.lower() in title_lower for keyword in settings.keywords)
     
     if not keyword_match:
         return False
     
     # Фильтр по цене
-    price = lot_data['price_value']
+    return price_in_range(lot.price_value, settings)
+
+def price_in_range(price: Optional[float], settings: UserSettings) -> bool:
+    """Проверка цены по диапазону пользователя (лоты без цены проходят)"""
     if price is not None:
         if price < settings.min_price:
             return False
@@ -384,6 +1470,131 @@ def apply_filters(lot_data: Dict[str, Any], settings: UserSettings) -> bool:
     
     return True
 
+class KeywordIndex:
+    """Общий индекс ключевых слов всех пользователей.
+    
+    Один проход автомата Ахо-Корасик по названию лота находит все вхождения
+    ключевых слов, а обратный индекс ключевое слово -> пользователи дает подписчиков.
+    """
+    
+    def __init__(self):
+        self.users_by_keyword: Dict[str, Set[int]] = {}
+        self.keywords_by_user: Dict[int, Set[str]] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        self._dirty = False
+    
+    def update_user(self, user_id: int, keywords: List[str]):
+        """Обновление ключевых слов пользователя; автомат перестраивается только при смене набора слов"""
+        new = {kw.lower() for kw in keywords if kw}
+        old = self.keywords_by_user.pop(user_id, set())
+        if new:
+            self.keywords_by_user[user_id] = new
+        
+        for keyword in old - new:
+            users = self.users_by_keyword[keyword]
+            users.discard(user_id)
+            if not users:
+                del self.users_by_keyword[keyword]
+                self._dirty = True
+        
+        for keyword in new - old:
+            if keyword not in self.users_by_keyword:
+                self.users_by_keyword[keyword] = set()
+                self._dirty = True
+            self.users_by_keyword[keyword].add(user_id)
+    
+    def _build(self):
+        """Построение автомата по текущему набору ключевых слов"""
+        goto: List[Dict[str, int]] = [{}]
+        output: List[List[str]] = [[]]
+        for keyword in self.users_by_keyword:
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append([])
+                state = next_state
+            output[state].append(keyword)
+        
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] = output[next_state] + output[fail[next_state]]
+        
+        self._goto, self._fail, self._output = goto, fail, output
+        self._dirty = False
+    
+    def find_keywords(self, text: str) -> Set[str]:
+        """Все ключевые слова, входящие в текст (текст в нижнем регистре)"""
+        if self._dirty:
+            self._build()
+        goto, fail, output = self._goto, self._fail, self._output
+        found: Set[str] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+    
+    def match(self, text: str, among: Optional[Set[int]] = None) -> Set[int]:
+        """Пользователи, чьи ключевые слова входят в текст (текст в нижнем регистре)"""
+        users: Set[int] = set()
+        for keyword in self.find_keywords(text):
+            if among is None:
+                users |= self.users_by_keyword[keyword]
+            else:
+                # Пересечение обходит меньшее из множеств: стоимость ограничена подписчиками категории
+                users.update(self.users_by_keyword[keyword] & among)
+        return users
+
+class PriceIndex:
+    """Диапазоны цен пользователей для проверки кандидатов после индекса ключевых слов.
+    
+    Кандидатов по ключевым словам немного (они ограничены подписчиками категории),
+    поэтому каждый проверяется по своему диапазону напрямую: стоимость не зависит
+    от общего числа пользователей бота.
+    """
+    
+    def __init__(self):
+        self.ranges: Dict[int, Tuple[float, float]] = {}
+    
+    def update_user(self, user_id: int, min_price: Optional[float] = None, max_price: Optional[float] = None):
+        """Обновление диапазона пользователя; без цен пользователь удаляется из индекса"""
+        if min_price is None:
+            self.ranges.pop(user_id, None)
+        else:
+            self.ranges[user_id] = (min_price, max_price)
+    
+    def match(self, price: Optional[float], among: Set[int]) -> Set[int]:
+        """Пользователи из among, чей диапазон допускает цену (лоты без цены проходят)"""
+        if price is None:
+            return set(among)
+        ranges = self.ranges
+        matched = set()
+        for user_id in among:
+            price_range = ranges.get(user_id)
+            if price_range is not None and price_range[0] <= price <= price_range[1]:
+                matched.add(user_id)
+        return matched
+
+# Общие индексы ключевых слов и цен, обновляются при изменении настроек
+keyword_index = KeywordIndex()
+price_index = PriceIndex()
+
 async def find_lots(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Поиск лотов по сохраненным настройкам"""
     if not HAVE_ALL_DEPS:
@@ -424,39 +1635,59 @@ async def find_lots(update: Update, context: ContextTypes.DEFAULT_TYPE):
     , parse_mode='Markdown')
     
     all_found = []
+    semaphore = asyncio.Semaphore(FIND_CONCURRENCY)
     
-    # Парсим каждую категорию
-    for url in settings.categories:
-        try:
-            found = await parse_funpay_category(url, settings)
-            all_found.extend(found)
-            
-            if found:
-                logger.info(f"Найдено {len(found)} лотов в {url}")
-                
-        except Exception as e:
-            logger.error(f"Ошибка при парсинге {url}: {e}")
-            await update.message.reply_text(f"⚠️ Ошибка при обработке категории {url[:50]}...")
+    async def parse_limited(url: str):
+        async with semaphore:
+            try:
+                return url, await parse_funpay_category(url, settings), None
+            except Exception as e:
+                return url, [], e
     
-    # Сортируем по цене
-    all_found.sort(key=lambda x: x['price_value'] or float('inf'))
+    # Парсим категории параллельно, обновляя статус по мере готовности
+    tasks = [asyncio.create_task(parse_limited(url)) for url in settings.categories]
+    done = 0
+    for next_done in asyncio.as_completed(tasks):
+        done += 1
+        url, found, error = await next_done
+        if error:
+            logger.error(f"Ошибка при парсинге {url}: {error}")
+            await update.message.reply_text(f"⚠️ Ошибка при обработке категории {url[:50]}...")
+        
+        all_found.extend(found)
+        if found:
+            logger.info(f"Найдено {len(found)} лотов в {url}")
+        
+        if done < len(tasks):
+            try:
+                await status_msg.edit_text(
+                    f"🔍 **Идет поиск...**\n\n"
+                    f"📁 Обработано категорий: {done} из {len(tasks)}\n"
+                    f"✅ Найдено лотов: {len(all_found)}"
+                , parse_mode='Markdown')
+            except Exception as e:
+                logger.debug(f"Не удалось обновить статус поиска: {e}")
     
-    # Отправляем результаты
+    # Отправляем результаты: самые дешевые лоты по возрастанию цены
     if all_found:
         message = f"✅ **Найдено {len(all_found)} лотов:**\n\n"
         
-        for i, lot in enumerate(all_found[:8], 1):  # Ограничиваем вывод
-            price_display = f"{lot['price_value']:.2f} ₽" if lot['price_value'] else lot['price_text']
+        shown = 0
+        for i, lot in enumerate(LotBatch(all_found).cheapest(8), 1):  # Ограничиваем вывод
+            price_display, title_line, link_line = render_lot(lot)
             
-            message += f"**{i}. {price_display}**\n"
-            message += f"📌 {lot['title']}\n"
-            if lot['link'] and lot['link'] != lot['category_url']:
-                message += f"🔗 [Открыть лот]({lot['link']})\n"
-            message += f"📁 *Категория*\n"
-            message += "―\n"
+            entry = f"**{i}. {price_display}**\n" + title_line
+            if lot.link != lot.category_url:
+                entry += link_line
+            entry += "📁 *Категория*\n―\n"
+            # Запас под хвост сообщения со счетчиком и советом
+            if len(message) + len(entry) > MESSAGE_MAX_LENGTH - 200:
+                break
+            message += entry
+            shown = i
         
-        if len(all_found) > 8:
-            message += f"\n... и еще **{len(all_found) - 8}** лотов\n"
+        if len(all_found) > shown:
+            message += f"\n... и еще **{len(all_found) - shown}** лотов\n"
         
         message += f"\n💡 **Совет:** Для постоянного мониторинга используйте `/monitor start`"
         
@@ -519,6 +1750,8 @@ async def clear_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if user_id in user_settings:
         del user_settings[user_id]
+    monitored_users.discard(user_id)
+    on_settings_changed(user_id)
     
     await update.message.reply_text("✅ **Все настройки очищены.**\n\nТеперь можно начать заново.")
 
@@ -552,106 +1785,893 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 """
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
-async def monitor_lots(context: ContextTypes.DEFAULT_TYPE):
-    """Фоновая задача мониторинга новых лотов"""
-    try:
-        for user_id, settings in list(user_settings.items()):
-            if not settings.categories or not settings.keywords:
+async def fetch_categories_once(urls) -> Dict[str, Tuple[List[CategoryPage], bool]]:
+    """Загрузка каждой уникальной категории ровно один раз; для каждой - страницы
+    и признак того, что первая страница загрузилась"""
+    semaphore = asyncio.Semaphore(MONITOR_FETCH_CONCURRENCY)
+    
+    async def fetch_limited(url: str) -> Tuple[List[CategoryPage], bool]:
+        async with semaphore:
+            try:
+                return await crawl_category(url)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки категории {url}: {e}")
+                return [category_pages.setdefault(url, CategoryPage())], False
+    
+    unique = list(dict.fromkeys(urls))
+    results = await asyncio.gather(*(fetch_limited(url) for url in unique))
+    return dict(zip(unique, results))
+
+def forget_category_pages(used: Optional[Set[str]] = None):
+    """Удаление из кэша страниц и профилей категорий, на которые никто не подписан"""
+    if used is None:
+        used = {url for settings in user_settings.values() for url in settings.categories}
+    for url in list(category_pages):
+        if url not in used:
+            del category_pages[url]
+            metrics.forget('category', url)
+    for url in list(extraction_profiles):
+        if url not in used:
+            del extraction_profiles[url]
+    for url in list(category_schedules):
+        if url not in used:
+            del category_schedules[url]
+
+def index_user(user_id: int):
+    """Обновление общих индексов по текущим настройкам пользователя"""
+    settings = user_settings.get(user_id)
+    keyword_index.update_user(user_id, settings.keywords if settings else [])
+    if settings:
+        price_index.update_user(user_id, settings.min_price, settings.max_price)
+    else:
+        price_index.update_user(user_id)
+
+def on_settings_changed(user_id: int):
+    """Обновление индексов и сохранение после изменения настроек пользователя"""
+    if storage:
+        storage.mark_dirty(user_id)
+    index_user(user_id)
+
+def reindex_all_users():
+    """Построение индексов по всем загруженным настройкам пользователей"""
+    for user_id in list(user_settings):
+        index_user(user_id)
+
+def match_lots(lots: List[Lot], users: Set[int]) -> Dict[int, List[Lot]]:
+    """Сопоставление лотов страницы с пользователями через общий индекс ключевых слов"""
+    matched: Dict[int, List[Lot]] = {}
+    for lot in lots:
+        candidates = keyword_index.match(lot.title.lower(), users)
+        if not candidates:
+            continue
+        for user_id in price_index.match(lot.price_value, candidates):
+            matched.setdefault(user_id, []).append(lot)
+    return matched
+
+def select_new_lots(page: CategoryPage) -> List[Lot]:
+    """Лоты страницы, которых еще не было среди просмотренных; все лоты страницы отмечаются просмотренными"""
+    bucket = seen_lots.current_bucket()
+    # Страница не менялась, и ее лоты уже отмечены в текущей корзине - новых лотов нет
+    if page.seen_version == page.version and page.seen_bucket == bucket:
+        return []
+    
+    lots_by_key = {lot.lot_key: lot for lot in page.lots}
+    unknown = [key for key in lots_by_key if key not in seen_lots]
+    if unknown and storage:
+        # После перезапуска сверяемся с базой, чтобы не разослать уведомления повторно
+        known = storage.lookup_seen(unknown)
+        unknown = [key for key in unknown if key not in known]
+    
+    added = seen_lots.mark(lots_by_key)
+    if storage:
+        storage.record_seen(added, bucket * seen_lots.bucket_span)
+    page.seen_version = page.version
+    page.seen_bucket = bucket
+    
+    return [lots_by_key[key] for key in unknown]
+
+@dataclass
+class CategoryDelta:
+    """Изменения категории с прошлого сравнения"""
+    removed: List[int] = field(default_factory=list)
+    # Лоты с изменившейся ценой и их прежняя цена
+    repriced: List[Tuple[Lot, Optional[float]]] = field(default_factory=list)
+
+def diff_category(first: CategoryPage) -> CategoryDelta:
+    """Снятые с продажи и переоцененные лоты относительно прошлого снимка категории.
+    
+    Снимок охватывает все закэшированные страницы сразу: лот, переехавший
+    на другую страницу, не считается снятым и сравнивается по цене как обычно.
+    """
+    delta = CategoryDelta()
+    pages = cached_pages(first)
+    version = tuple(page.version for page in pages)
+    if first.snapshot_version == version:
+        return delta
+    
+    previous = first.snapshot
+    current: Dict[int, Optional[float]] = {}
+    for page in pages:
+        for lot in page.lots:
+            key = lot.lot_key
+            if key in current:
                 continue
-            
+            price = lot.price_value
+            current[key] = price
+            if key in previous and previous[key] != price:
+                delta.repriced.append((lot, previous[key]))
+    delta.removed = [key for key in previous if key not in current]
+    
+    first.snapshot = current
+    first.snapshot_version = version
+    return delta
+
+def price_drops(repriced: List[Tuple[Lot, Optional[float]]]) -> List[Lot]:
+    """Подешевевшие лоты с отметкой прежней цены"""
+    return [lot.with_old_price(old_price) for lot, old_price in repriced
+            if old_price is not None and lot.price_value is not None and lot.price_value < old_price]
+
+def match_price_drops(lots: List[Lot], users: Set[int]) -> Dict[int, List[Lot]]:
+    """Подешевевшие лоты, цена которых только что вошла в диапазон пользователя"""
+    matched: Dict[int, List[Lot]] = {}
+    for lot in lots:
+        candidates = keyword_index.match(lot.title.lower(), users)
+        if not candidates:
+            continue
+        for user_id in price_index.match(lot.price_value, candidates):
+            # Об этом лоте пользователь уже мог узнать, пока цена была в диапазоне
+            if not price_in_range(lot.old_price, user_settings[user_id]):
+                matched.setdefault(user_id, []).append(lot)
+    return matched
+
+def category_changes(pages: List[CategoryPage]) -> Tuple[List[Lot], List[Lot], int]:
+    """Новые лоты, подешевевшие лоты и число снятых лотов по всем страницам категории.
+    
+    При первом опросе категории без сведений о просмотренных лотах новых лотов нет:
+    вся выдача запоминается молча.
+    """
+    new_lots: List[Lot] = []
+    for page in pages:
+        new_lots.extend(select_new_lots(page))
+    first = pages[0]
+    if not first.seeded and first.lots:
+        first.seeded = True
+        listed = {lot.lot_key for page in pages for lot in page.lots}
+        # Категорию опросили впервые, и ни один ее лот не встречался ни в памяти, ни в базе:
+        # лоты только запоминаются, уже выставленные показывает /find
+        if len(new_lots) == len(listed):
+            logger.info(f"Категория {first.lots[0].category_url}: запомнено {len(listed)} лотов без уведомлений")
+            new_lots = []
+    delta = diff_category(first)
+    return new_lots, price_drops(delta.repriced), len(delta.removed)
+
+def match_changes(new_lots: List[Lot], dropped: List[Lot],
+                  users: Set[int]) -> Dict[int, List[Lot]]:
+    """Новые лоты и подешевевшие в диапазон лоты для каждого пользователя"""
+    found = match_lots(new_lots, users) if new_lots else {}
+    if dropped:
+        for user_id, lots in match_price_drops(dropped, users).items():
+            found.setdefault(user_id, []).extend(lots)
+    return found
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не более capacity подряд"""
+    
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def delay(self) -> float:
+        """Сколько секунд ждать до появления токена"""
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+    
+    async def acquire(self):
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+        self.consume()
+    
+    def pause(self, seconds: float):
+        """Запрет выдачи токенов на заданное время (например, по RetryAfter)"""
+        self._refill()
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+    
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+# Отформатированные части лотов: (цена, строка названия, строка ссылки) по ключу лота, цене и названию
+rendered_lots: 'OrderedDict[Tuple[int, Optional[float], str], Tuple[str, str, str]]' = OrderedDict()
+
+def render_lot(lot: Lot) -> Tuple[str, str, str]:
+    """Экранированные для Markdown части сообщения о лоте; каждый лот форматируется один раз
+    независимо от числа подписчиков, которым он уйдет"""
+    key = (lot.lot_key, lot.price_value, lot.title)
+    parts = rendered_lots.get(key)
+    if parts is not None:
+        rendered_lots.move_to_end(key)
+        return parts
+    
+    price_display = f"{lot.price_value:.2f} ₽" if lot.price_value else lot.price_text
+    parts = (
+        escape_markdown(price_display),
+        f"📌 {escape_markdown(lot.title)}\n",
+        f"🔗 [Открыть лот]({lot.link})\n" if lot.link else "",
+    )
+    rendered_lots[key] = parts
+    if len(rendered_lots) > RENDER_CACHE_SIZE:
+        rendered_lots.popitem(last=False)
+    return parts
+
+def format_lot_notification(lot: Lot) -> str:
+    """Фрагмент уведомления об одном лоте"""
+    price_display, title_line, link_line = render_lot(lot)
+    
+    fragment = ""
+    if lot.old_price is not None:
+        fragment += f"📉 Цена снижена, было {lot.old_price:.2f} ₽\n"
+    return fragment + f"💰 **{price_display}**\n" + title_line + link_line
+
+def build_notification(lots: List[Lot], skipped: int = 0) -> Tuple[str, int]:
+    """Сборка одного сообщения из нескольких лотов; возвращает текст и число вошедших лотов"""
+    footer = f"\n⚠️ Еще {skipped} лотов пропущено из-за переполнения очереди" if skipped else ""
+    separator = "―\n"
+    # Места на лоты: лимит сообщения за вычетом самого длинного заголовка и подвала
+    budget = MESSAGE_MAX_LENGTH - len(footer) - len(f"📉 **Подешевевшие лоты ({NOTIFY_LOTS_PER_MESSAGE}):**\n\n")
+    
+    fragments = []
+    used = 0
+    for lot in lots[:NOTIFY_LOTS_PER_MESSAGE]:
+        fragment = format_lot_notification(lot)
+        cost = len(fragment) + (len(separator) if fragments else 0)
+        if fragments and used + cost > budget:
+            break
+        fragments.append(fragment)
+        used += cost
+    
+    # Сообщение только о снижении цен не выдаем за новые лоты
+    drops_only = all(lot.old_price is not None for lot in lots[:len(fragments)])
+    if len(fragments) == 1:
+        header = "📉 **Цена снижена!**\n\n" if drops_only else "🆕 **Новый лот!**\n\n"
+    elif drops_only:
+        header = f"📉 **Подешевевшие лоты ({len(fragments)}):**\n\n"
+    else:
+        header = f"🆕 **Новые лоты ({len(fragments)}):**\n\n"
+    message = header + separator.join(fragments) + footer
+    return message[:MESSAGE_MAX_LENGTH], len(fragments)
+
+class NotificationDispatcher:
+    """Очередь исходящих уведомлений с ограничением частоты.
+    
+    Лоты копятся по чатам и отправляются рабочими задачами: несколько лотов одного
+    чата объединяются в одно сообщение, соблюдаются общий и початовый лимиты Telegram.
+    """
+    
+    def __init__(self, bot, workers: int = NOTIFY_WORKERS):
+        self.bot = bot
+        self.workers = workers
+        self.pending: Dict[int, List[Lot]] = {}
+        self.skipped: Dict[int, int] = {}
+        self.scheduled: Set[int] = set()
+        self.ready: 'asyncio.Queue[int]' = asyncio.Queue()
+        self.global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.tasks: List[asyncio.Task] = []
+    
+    def start(self):
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+    
+    @property
+    def queued_lots(self) -> int:
+        return sum(len(lots) for lots in self.pending.values())
+    
+    def enqueue(self, chat_id: int, lots: List[Lot]):
+        """Постановка лотов в очередь чата"""
+        pending = self.pending.setdefault(chat_id, [])
+        room = NOTIFY_MAX_PENDING_PER_CHAT - len(pending)
+        if len(lots) > room:
+            self.skipped[chat_id] = self.skipped.get(chat_id, 0) + len(lots) - max(room, 0)
+            metrics.inc('notify_lots_dropped_total', len(lots) - max(room, 0))
+            lots = lots[:max(room, 0)]
+        pending.extend(lots)
+        self._schedule(chat_id)
+    
+    def _schedule(self, chat_id: int, delay: float = 0):
+        if chat_id in self.scheduled:
+            return
+        self.scheduled.add(chat_id)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.ready.put_nowait, chat_id)
+        else:
+            self.ready.put_nowait(chat_id)
+    
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                # Забываем чаты, лимит которых уже полностью восстановился
+                self.chat_buckets = {chat: b for chat, b in self.chat_buckets.items() if not b.full}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(TELEGRAM_CHAT_RATE)
+        return bucket
+    
+    async def _worker(self):
+        while True:
+            chat_id = await self.ready.get()
+            self.scheduled.discard(chat_id)
+            try:
+                await self._send_next(chat_id)
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомления в чат {chat_id}: {e}")
+    
+    async def _send_next(self, chat_id: int):
+        pending = self.pending.get(chat_id)
+        if not pending:
+            self.pending.pop(chat_id, None)
+            return
+        
+        # Лимит чата еще не восстановился - вернемся к чату позже, не занимая задачу
+        bucket = self._chat_bucket(chat_id)
+        delay = bucket.delay()
+        if delay > 0:
+            self._schedule(chat_id, delay)
+            return
+        
+        # Токен чата забираем до ожидания общего лимита: пока мы ждем, другая задача,
+        # взявшая этот же чат, увидит исчерпанный лимит и отложит его
+        bucket.consume()
+        await self.global_bucket.acquire()
+        
+        message, count = build_notification(pending, self.skipped.get(chat_id, 0))
+        sent = pending[:count]
+        del pending[:count]
+        started = time.perf_counter()
+        result = 'error'
+        try:
+            await self.bot.send_message(
+                chat_id=chat_id,
+                text=message,
+                parse_mode='Markdown',
+                disable_web_page_preview=True
+            )
+            self.skipped.pop(chat_id, None)
+            result = 'ok'
+            metrics.inc('notify_lots_sent_total', count)
+        except RetryAfter as e:
+            result = 'retry_after'
+            retry_after = e.retry_after
+            if hasattr(retry_after, 'total_seconds'):
+                retry_after = retry_after.total_seconds()
+            logger.warning(f"Telegram просит подождать {retry_after} с перед отправкой в чат {chat_id}")
+            pending[:0] = sent
+            bucket.pause(retry_after)
+            # Ограничение флуда действует на весь бот: приостанавливаем и остальные отправки
+            self.global_bucket.pause(retry_after)
+        except Exception as e:
+            logger.error(f"Ошибка отправки уведомления в чат {chat_id}: {e}")
+        metrics.observe('funpay_stage_seconds', time.perf_counter() - started, stage='send')
+        metrics.inc('telegram_messages_total', result=result)
+        
+        if pending:
+            self._schedule(chat_id, bucket.delay())
+        else:
+            self.pending.pop(chat_id, None)
+
+# Очередь уведомлений (создается в post_init или при первом цикле мониторинга)
+notifier: Optional[NotificationDispatcher] = None
+
+def get_notifier(bot) -> NotificationDispatcher:
+    """Общая очередь уведомлений для бота"""
+    global notifier
+    if notifier is None:
+        notifier = NotificationDispatcher(bot)
+        notifier.start()
+    return notifier
+
+@dataclass
+class CategorySchedule:
+    """Адаптивное расписание опроса категории"""
+    interval: float = MONITOR_INTERVAL
+    next_due: float = 0.0
+    last_polled: Optional[float] = None
+    rate: float = 0.0  # Сглаженная частота появления новых лотов, в секунду
+    
+    def update(self, new_lots: int, now: float):
+        """Пересчет интервала по числу новых лотов с прошлого опроса"""
+        # Первый опрос показывает все лоты как новые, для оценки частоты он не годится
+        if self.last_polled is not None:
+            elapsed = max(now - self.last_polled, 1.0)
+            self.rate = (MONITOR_RATE_SMOOTHING * new_lots / elapsed
+                         + (1 - MONITOR_RATE_SMOOTHING) * self.rate)
+            interval = MONITOR_TARGET_NEW_LOTS / self.rate if self.rate > 0 else self.interval * 2
+            self.interval = min(max(interval, MONITOR_MIN_INTERVAL), MONITOR_MAX_INTERVAL)
+        self.last_polled = now
+        self.next_due = now + self.interval
+
+# Расписания опроса категорий и общий лимит загрузок
+category_schedules: Dict[str, CategorySchedule] = {}
+fetch_budget = TokenBucket(MONITOR_MAX_FETCH_RATE, MONITOR_MAX_FETCH_RATE * MONITOR_TICK)
+
+def due_categories(urls: Iterable[str], now: float) -> List[str]:
+    """Категории, которые пора опросить, в пределах общего лимита загрузок"""
+    due = []
+    for url in urls:
+        schedule = category_schedules.setdefault(url, CategorySchedule())
+        if schedule.next_due <= now:
+            due.append(url)
+    
+    # Сначала самые просроченные; остальные дождутся следующего тика
+    due.sort(key=lambda url: category_schedules[url].next_due)
+    selected = []
+    for url in due:
+        if fetch_budget.delay() > 0:
+            break
+        fetch_budget.consume()
+        selected.append(url)
+    return selected
+
+def category_subscribers() -> Dict[str, List[int]]:
+    """Подписчики каждой категории среди пользователей с мониторингом"""
+    subscribers: Dict[str, List[int]] = {}
+    for user_id in list(monitored_users):
+        settings = user_settings.get(user_id)
+        if settings and settings.categories and settings.keywords:
             for url in settings.categories:
-                try:
-                    found = await parse_funpay_category(url, settings)
-                    new_lots = []
-                    
-                    for lot in found:
-                        lot_id = lot['lot_id']
-                        if lot_id not in settings.monitored_lots:
-                            new_lots.append(lot)
-                            settings.monitored_lots[lot_id] = datetime.now()
-                    
-                    # Отправляем уведомления о новых лотах
-                    for lot in new_lots[:3]:  # Не больше 3 за раз
-                        price_display = f"{lot['price_value']:.2f} ₽" if lot['price_value'] else lot['price_text']
-                        
-                        message = f"🆕 **Новый лот!**\n\n"
-                        message += f"💰 **{price_display}**\n"
-                        message += f"📌 {lot['title']}\n"
-                        if lot['link']:
-                            message += f"🔗 [Открыть лот]({lot['link']})"
-                        
-                        await context.bot.send_message(
-                            chat_id=user_id,
-                            text=message,
-                            parse_mode='Markdown',
-                            disable_web_page_preview=True
-                        )
-                        await asyncio.sleep(1)
-                    
-                    # Очищаем старые записи (старше 7 дней)
-                    week_ago = datetime.now().timestamp() - 7 * 24 * 3600
-                    old_lots = [lot_id for lot_id, ts in settings.monitored_lots.items() 
-                              if ts.timestamp() < week_ago]
-                    for lot_id in old_lots:
-                        del settings.monitored_lots[lot_id]
-                        
-                except Exception as e:
-                    logger.error(f"Ошибка мониторинга для user {user_id}: {e}")
+                subscribers.setdefault(url, []).append(user_id)
+    return subscribers
+
+async def monitor_lots(bot, force: bool = False):
+    """Один цикл мониторинга: опрос категорий, которым подошел срок (при force - всех)"""
+    started = time.perf_counter()
+    try:
+        subscribers = category_subscribers()
+        now = time.monotonic()
+        urls = list(subscribers) if force else due_categories(subscribers, now)
+        
+        # Общий этап загрузки: каждая категория скачивается и разбирается один раз за цикл,
+        # независимо от количества подписанных на нее пользователей
+        pages = await fetch_categories_once(urls)
+        for url, (category, loaded) in pages.items():
+            if loaded:
+                lot_cache.put(url, category_lots(category[0]))
+        
+        for url in urls:
+            users = subscribers[url]
+            try:
+                # Сопоставляем с подписчиками только лоты, которых раньше не было,
+                # и подешевевшие: в сопоставление идет только разница с прошлым опросом
+                new_lots, dropped, removed = category_changes(pages[url][0])
+                category_schedules.setdefault(url, CategorySchedule()).update(len(new_lots), now)
+                if removed:
+                    metrics.inc('monitor_removed_lots_total', removed, category=url)
+                if not new_lots and not dropped:
+                    continue
+                metrics.inc('monitor_new_lots_total', len(new_lots), category=url)
+                metrics.inc('monitor_price_drops_total', len(dropped), category=url)
+                
+                matched_at = time.perf_counter()
+                found = match_changes(new_lots, dropped, set(users))
+                metrics.observe('funpay_stage_seconds', time.perf_counter() - matched_at,
+                                stage='match', category=url)
+                
+                # Отправка идет в фоне, сбор данных не ждет ответов Telegram
+                for user_id, lots in found.items():
+                    get_notifier(bot).enqueue(user_id, lots)
+                
+            except Exception as e:
+                logger.error(f"Ошибка мониторинга категории {url}: {e}")
+        
+        forget_category_pages()
+        if urls:
+            metrics.observe('monitor_cycle_seconds', time.perf_counter() - started)
+            metrics.inc('monitor_cycles_total')
+            metrics.set_gauge('monitor_categories_polled', len(urls))
+        update_queue_gauges()
     
     except Exception as e:
         logger.error(f"Ошибка в задаче мониторинга: {e}")
 
+def update_queue_gauges():
+    """Обновление показателей очередей и объема отслеживаемых данных"""
+    metrics.set_gauge('notify_queue_lots', notifier.queued_lots if notifier else 0)
+    metrics.set_gauge('notify_queue_chats', len(notifier.pending) if notifier else 0)
+    metrics.set_gauge('notify_ready_chats', notifier.ready.qsize() if notifier else 0)
+    metrics.set_gauge('monitor_users', len(monitored_users))
+    metrics.set_gauge('monitor_categories', len(category_schedules))
+    metrics.set_gauge('seen_lots', len(seen_lots))
+
+async def metrics_handler(request: 'web.Request') -> 'web.Response':
+    """Эндпоинт метрик в текстовом формате Prometheus"""
+    update_queue_gauges()
+    return web.Response(
+        body=metrics.render().encode(),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+    )
+
+async def start_metrics_server() -> Optional['web.AppRunner']:
+    """Запуск локального HTTP-сервера метрик"""
+    if not METRICS_PORT:
+        return None
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    logger.info(f"Метрики доступны на http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return runner
+
+class HashRing:
+    """Кольцо консистентного хэширования: категория закрепляется за одним сборщиком,
+    при появлении или выбытии сборщика переезжает лишь небольшая часть категорий"""
+    
+    def __init__(self, nodes: Iterable[str], replicas: int = SHARD_RING_REPLICAS):
+        points = sorted((self._hash(f'{node}#{index}'), node) for node in nodes for index in range(replicas))
+        self.points = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+    
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+    
+    def owner(self, key: str) -> Optional[str]:
+        if not self.points:
+            return None
+        return self.nodes[bisect.bisect(self.points, self._hash(key)) % len(self.points)]
+
+async def heartbeat_loop(worker_id: str, stopped: asyncio.Event):
+    """Периодическая отметка сборщика, независимая от длительности опроса категорий"""
+    while not stopped.is_set():
+        try:
+            await asyncio.wait_for(stopped.wait(), SHARD_HEARTBEAT_TIMEOUT / 3)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await storage.heartbeat(worker_id, time.time())
+        except Exception as e:
+            logger.error(f"Ошибка отметки сборщика {worker_id}: {e}")
+
+async def worker_loop(worker_id: str):
+    """Сборщик: опрашивает свою часть категорий и передает новые лоты боту через базу"""
+    global storage
+    storage = Storage(DB_PATH)
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    logger.info(f"Сборщик {worker_id} запущен")
+    owned: Set[str] = set()
+    stopped = asyncio.Event()
+    heartbeats: Optional[asyncio.Task] = None
+    try:
+        # Даем одновременно запущенным сборщикам отметиться, прежде чем делить категории
+        await storage.heartbeat(worker_id, time.time())
+        heartbeats = asyncio.create_task(heartbeat_loop(worker_id, stopped))
+        await asyncio.sleep(MONITOR_FIRST_DELAY)
+        while True:
+            wall = time.time()
+            workers = storage.live_workers(wall - SHARD_HEARTBEAT_TIMEOUT) | {worker_id}
+            ring = HashRing(sorted(workers))
+            categories = storage.monitored_categories()
+            current = {url for url in categories if ring.owner(url) == worker_id}
+            if current != owned:
+                logger.info(f"Сборщик {worker_id}: категорий {len(current)} из {len(categories)}, "
+                            f"сборщиков {len(workers)}")
+                owned = current
+            
+            now = time.monotonic()
+            urls = due_categories(owned, now)
+            pages = await fetch_categories_once(urls)
+            for url in urls:
+                try:
+                    new_lots, dropped, _ = category_changes(pages[url][0])
+                    category_schedules.setdefault(url, CategorySchedule()).update(len(new_lots), now)
+                    if new_lots or dropped:
+                        storage.queue_lots(url, new_lots + dropped)
+                except Exception as e:
+                    logger.error(f"Ошибка опроса категории {url}: {e}")
+            
+            forget_category_pages(owned)
+            try:
+                await storage.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения данных сборщика: {e}")
+            await asyncio.sleep(MONITOR_TICK)
+    except asyncio.CancelledError:
+        logger.info(f"Сборщик {worker_id} остановлен")
+    finally:
+        # Останавливаем отметки без отмены, чтобы не прервать запись в базу на середине
+        stopped.set()
+        if heartbeats:
+            await heartbeats
+        await close_http_session()
+        await storage.flush()
+        storage.remove_worker(worker_id)
+        storage.close()
+
+def run_worker(worker_id: str):
+    """Точка входа процесса-сборщика"""
+    global PARSE_WORKERS
+    # Сборщик сам является отдельным процессом, страницы он разбирает на месте
+    PARSE_WORKERS = 0
+    asyncio.run(worker_loop(worker_id))
+
+def start_workers(count: int) -> List[multiprocessing.Process]:
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_worker, args=(f'worker-{index}',), name=f'worker-{index}')
+                 for index in range(count)]
+    for process in processes:
+        process.start()
+    return processes
+
+async def stop_workers(processes: List[multiprocessing.Process]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        await asyncio.to_thread(process.join, SHARD_HEARTBEAT_TIMEOUT)
+
+async def consume_worker_lots(bot):
+    """Сопоставление лотов, переданных сборщиками, с подписчиками и постановка уведомлений"""
+    subscribers = category_subscribers()
+    while True:
+        rows = await storage.take_lots(SHARD_QUEUE_BATCH)
+        for url, payload in rows:
+            users = subscribers.get(url)
+            if not users:
+                continue
+            try:
+                lots = [lot_from_record(record, url, QUEUE_RECORD_FIELDS)
+                        for record in json.loads(payload)]
+                new_lots = [lot for lot in lots if lot.old_price is None]
+                dropped = [lot for lot in lots if lot.old_price is not None]
+                metrics.inc('monitor_new_lots_total', len(new_lots), category=url)
+                metrics.inc('monitor_price_drops_total', len(dropped), category=url)
+                for user_id, found in match_changes(new_lots, dropped, set(users)).items():
+                    get_notifier(bot).enqueue(user_id, found)
+            except Exception as e:
+                logger.error(f"Ошибка обработки лотов сборщика для {url}: {e}")
+        if len(rows) < SHARD_QUEUE_BATCH:
+            break
+    update_queue_gauges()
+
+async def monitor_loop(application: Application):
+    """Центральный планировщик: одна задача опрашивает категории всех подписанных пользователей
+    (в режиме сборщиков - забирает найденные ими лоты)"""
+    await asyncio.sleep(MONITOR_FIRST_DELAY)
+    while True:
+        if SHARD_WORKERS and storage:
+            try:
+                await consume_worker_lots(application.bot)
+            except Exception as e:
+                logger.error(f"Ошибка получения лотов от сборщиков: {e}")
+        elif monitored_users:
+            await monitor_lots(application.bot)
+        if storage:
+            try:
+                await storage.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения данных: {e}")
+        await asyncio.sleep(MONITOR_TICK)
+
+async def post_init(application: Application):
+    """Запуск фоновых задач после инициализации приложения"""
+    global storage
+    storage = Storage(DB_PATH)
+    loaded_settings, loaded_monitoring = storage.load_users()
+    user_settings.update(loaded_settings)
+    monitored_users.update(loaded_monitoring)
+    logger.info(f"Загружено пользователей: {len(loaded_settings)}, с мониторингом: {len(loaded_monitoring)}")
+    
+    reindex_all_users()
+    get_http_session()
+    get_notifier(application.bot)
+    try:
+        application.bot_data['metrics_runner'] = await start_metrics_server()
+    except OSError as e:
+        logger.error(f"Не удалось запустить сервер метрик: {e}")
+    if SHARD_WORKERS:
+        application.bot_data['workers'] = start_workers(SHARD_WORKERS)
+        logger.info(f"Запущено сборщиков: {SHARD_WORKERS}")
+    application.bot_data['monitor_task'] = asyncio.create_task(monitor_loop(application))
+
+async def post_shutdown(application: Application):
+    """Остановка фоновых задач при завершении приложения"""
+    task = application.bot_data.pop('monitor_task', None)
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await stop_workers(application.bot_data.pop('workers', []))
+    await lot_cache.close()
+    await close_http_session()
+    close_parse_pool()
+    
+    runner = application.bot_data.pop('metrics_runner', None)
+    if runner:
+        await runner.cleanup()
+    
+    global notifier, storage
+    if notifier:
+        await notifier.stop()
+        notifier = None
+    if storage:
+        await storage.flush()
+        storage.close()
+        storage = None
+
 async def start_monitor(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запуск мониторинга"""
     user_id = update.effective_user.id
     
+    if context.args and context.args[0].lower() == 'stop':
+        await stop_monitor(update, context)
+        return
+    
     if user_id not in user_settings:
         await update.message.reply_text("❌ Сначала настройте бота (категории и ключевые слова)")
         return
     
-    # Удаляем старые задачи
-    current_jobs = context.job_queue.get_jobs_by_name(f"monitor_{user_id}")
-    for job in current_jobs:
-        job.schedule_removal()
-    
-    # Добавляем новую задачу (проверка каждые 10 минут)
-    context.job_queue.run_repeating(
-        monitor_lots,
-        interval=600,  # 10 минут
-        first=5,
-        chat_id=user_id,
-        name=f"monitor_{user_id}",
-        data={'user_id': user_id}
-    )
+    monitored_users.add(user_id)
+    if storage:
+        storage.mark_dirty(user_id)
     
     await update.message.reply_text(
         "✅ **Мониторинг запущен!**\n\n"
-        "Бот будет проверять категории каждые 10 минут и присылать уведомления о новых лотах.\n\n"
+        f"Бот будет проверять категории раз в {MONITOR_MIN_INTERVAL // 60}-{MONITOR_MAX_INTERVAL // 60} минут "
+        f"(чем активнее категория, тем чаще) и присылать уведомления о новых лотах.\n\n"
         "🛑 Остановить: `/monitor stop`"
     , parse_mode='Markdown')
 
 async def stop_monitor(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Остановка мониторинга"""
     user_id = update.effective_user.id
-    job_name = f"monitor_{user_id}"
     
-    current_jobs = context.job_queue.get_jobs_by_name(job_name)
-    if current_jobs:
-        for job in current_jobs:
-            job.schedule_removal()
+    if user_id in monitored_users:
+        monitored_users.discard(user_id)
+        if storage:
+            storage.mark_dirty(user_id)
         await update.message.reply_text("⏹️ **Мониторинг остановлен**")
     else:
         await update.message.reply_text("ℹ️ Мониторинг не был запущен")
 
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сводка метрик для администраторов"""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Команда доступна только администраторам")
+        return
+    
+    update_queue_gauges()
+    uptime = int(time.time() - metrics.started)
+    cycle = metrics.merged('monitor_cycle_seconds')
+    lines = [
+        "📊 Статистика бота",
+        "",
+        f"Время работы: {uptime // 3600} ч {uptime % 3600 // 60} мин",
+        f"Пользователей: {len(user_settings)}, с мониторингом: {len(monitored_users)}",
+        f"Категорий в расписании: {len(category_schedules)}, просмотренных лотов: {len(seen_lots)}",
+        f"Циклов мониторинга: {cycle.count}, среднее {cycle.total / max(cycle.count, 1):.2f} с, "
+        f"p95 ≤ {cycle.quantile(0.95):g} с",
+        f"Очередь уведомлений: {notifier.queued_lots if notifier else 0} лотов "
+        f"в {len(notifier.pending) if notifier else 0} чатах",
+        "",
+        "Этапы (вызовов, среднее, p95):",
+    ]
+    for stage in ('fetch', 'parse', 'extract', 'filter', 'match', 'send'):
+        histogram = metrics.merged('funpay_stage_seconds', stage=stage)
+        if histogram.count:
+            lines.append(f"• {stage}: {histogram.count}, {histogram.total / histogram.count * 1000:.1f} мс, "
+                         f"≤ {histogram.quantile(0.95) * 1000:g} мс")
+    
+    for title, name, label in (("Ответы FunPay", 'funpay_fetch_total', 'status'),
+                               ("Селекторы лотов", 'funpay_selector_total', 'selector'),
+                               ("Сообщения Telegram", 'telegram_messages_total', 'result')):
+        counts = metrics.counter_by(name, label)
+        if counts:
+            lines.append(f"{title}: " + ", ".join(f"{key} {value:g}" for key, value in sorted(counts.items())))
+    
+    # Самые медленные категории по среднему времени загрузки и разбора
+    per_category: Dict[str, List[float]] = {}
+    for (name, labels), series in metrics.histograms.items():
+        labels = dict(labels)
+        if name == 'funpay_stage_seconds' and labels.get('stage') in ('fetch', 'parse', 'extract'):
+            total = per_category.setdefault(labels['category'], [0.0, 0])
+            total[0] += series.total
+            if labels['stage'] == 'fetch':
+                total[1] += series.count
+    slowest = sorted(((total / count, url) for url, (total, count) in per_category.items() if count), reverse=True)
+    if slowest:
+        lines.append("")
+        lines.append("Самые медленные категории:")
+        for seconds, url in slowest[:5]:
+            lines.append(f"• {url} - {seconds * 1000:.0f} мс")
+    
+    await update.message.reply_text("\n".join(lines)[:MESSAGE_MAX_LENGTH], disable_web_page_preview=True)
+
+async def run_webhook(application: Application):
+    """Прием обновлений через вебхук на локальном aiohttp-сервере"""
+    async def handle_update(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET_TOKEN and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET_TOKEN:
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            logger.warning(f"Некорректное обновление вебхука: {e}")
+            return web.Response(status=400)
+        # Обработка идет в очереди приложения, Telegram получает ответ сразу
+        await application.update_queue.put(update)
+        return web.Response()
+    
+    app = web.Application()
+    app.router.add_post(f'/{WEBHOOK_PATH}', handle_update)
+    runner = web.AppRunner(app, access_log=None)
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            allowed_updates=ALLOWED_UPDATES,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            max_connections=UPDATE_CONCURRENCY,
+        )
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+        await application.start()
+        logger.info(f"Вебхук принимает обновления на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}")
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
 def main():
-    """Запуск бота"""
+    """Запуск бота (или отдельного сборщика: python bot.py worker <id>)"""
     if not HAVE_ALL_DEPS:
         print("❌ Установите необходимые библиотеки:")
         print("pip install python-telegram-bot aiohttp beautifulsoup4")
         return
     
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        run_worker(sys.argv[2] if len(sys.argv) > 2 else f'worker-{multiprocessing.current_process().pid}')
+        return
+    
     try:
-        application = Application.builder().token(TOKEN).build()
+        application = (
+            Application.builder()
+            .token(TOKEN)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .concurrent_updates(UPDATE_CONCURRENCY)
+            .build()
+        )
         
         # Регистрация обработчиков
         application.add_handler(CommandHandler("start", help_command))
@@ -663,6 +2683,7 @@ def main():
         application.add_handler(CommandHandler("clear", clear_settings))
         application.add_handler(CommandHandler("monitor", start_monitor))
         application.add_handler(CommandHandler("stop", stop_monitor))
+        application.add_handler(CommandHandler("stats", show_stats))
         
         # Обработчик ссылок на категории
         application.add_handler(MessageHandler(
@@ -671,7 +2692,10 @@ def main():
         ))
         
         logger.info("Бот запущен...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if WEBHOOK_URL:
+            asyncio.run(run_webhook(application))
+        else:
+            application.run_polling(allowed_updates=ALLOWED_UPDATES)
         
     except Exception as e:
         logger.error(f"Ошибка запуска бота: {e}")